@@ -2,65 +2,280 @@
 Initializes and manages analogue-to-digital converter functionality.
 
 This module provides functions to initialize and configure the analogue-to-digital
-converter (ADC) interface, fetch individual or collective input channel values, and
-validate analogue channel keys. The module ensures compatibility with ADC devices
-by dynamically checking their presence and functionality at runtime.
+converter (ADC) interface and fetch individual or collective input channel values.
+The module ensures compatibility with ADC devices by dynamically checking their
+presence and functionality at runtime.
+
+A background sampler thread for each ADC keeps one AnalogIn object per enabled channel of
+that ADC and cycles through its channels every 'analogue_sample_interval' seconds at the
+data rate 'analogue_data_rate', averaging 'analogue_oversample' conversions per reading. API
+reads return the latest averaged reading and its timestamp without waiting for the I2C bus.
+
+Channels with a 'calibration' setting (see calibration_class) also report the reading in
+engineering units, converted from each batch of oversampled voltages in one NumPy pass.
+
+Several ADS1115 boards can be fitted at the I2C addresses listed in 'analogue_devices' (an
+empty list means the single board at 'analogue_i2c'). Board n provides channels 4n+1 to
+4n+4, a channel setting may override this with 'device' (index in the list) and 'pin'.
+As each board has its own sampler thread, the conversions on different boards overlap
+rather than waiting for each other. 'analogue_simulate' replaces the boards with simulated
+devices that have the same conversion timing, for running and testing without hardware
+(see tests/test_analogue_class.py).
+
+reload_analogue() applies changed channel, calibration and device settings in place by
+stopping the sampler, rebuilding the channel map (and the devices if their addresses or data
+rate changed) and starting a new sampler.
 """
-from app_control import settings
+from threading import Thread, Lock, Event
+from time import time, sleep
+from app_control import settings, settings_update
 from logmanager import logger
-if settings['analogue_installed']:
-    import board
-    from adafruit_ads1x15.ads1115 import ADS1115
-    from adafruit_ads1x15.analog_in import AnalogIn
+from datastore_class import data_store, CALIBRATED_SUFFIX
+from calibration_class import make_calibration
+
+CHANNELS_PER_DEVICE = 4
+SIMULATED_BUS = Lock()  # the simulated I2C bus, held only while a register is written or read
+SIMULATED_TRANSFER = 0.0002  # seconds to transfer a register on a 400 kHz bus
+
+
+def analogue_device_addresses():
+    """
+    Returns the I2C addresses of the analogue to digital convertors, the position in the list is the device index.
+    """
+    return settings['analogue_devices'] or [settings['analogue_i2c']]
+
+
+def build_analogue_channels():
+    """
+    Fills analogue_channels with the settings of each channel of the convertors, adding default settings for
+    channels that have none, and analogue_calibrations with the calibration of each channel. The dicts are
+    updated in place as other modules hold references to them.
+    """
+    channel_ids = range(1, CHANNELS_PER_DEVICE * len(analogue_device_addresses()) + 1)
+    missing = [interface for interface in channel_ids if str(interface) not in settings['analogue_channels']]
+    if missing:
+        with settings_update() as new_settings:
+            for interface in missing:
+                new_settings['analogue_channels'][str(interface)] = {'name': 'Analogue %d' % interface,
+                                                                     'pin': (interface - 1) % CHANNELS_PER_DEVICE,
+                                                                     'enabled': False}
+    for interface in channel_ids:
+        channel_settings = settings['analogue_channels'][str(interface)]
+        analogue_channels[interface] = channel_settings
+        analogue_calibrations[interface] = make_calibration(channel_settings.get('calibration'),
+                                                            channel_settings['name'])
+    for interface in [interface for interface in analogue_channels if interface not in channel_ids]:
+        del analogue_channels[interface]
+        del analogue_calibrations[interface]
 
 
+analogue_channels = {}
+analogue_calibrations = {}
+build_analogue_channels()
 
-analogue_channels={}
-for interface in range(1, 5):
-    analogue_channels[interface] = settings['analogue_channels'][str(interface)]
+ADC_DEVICES = {}
+DEVICE_SETTINGS = None  # the addresses, data rate and simulation setting the devices were created with
+SAMPLER = None
+
+
+def channel_device(channel_id):
+    """Returns the device index of a channel."""
+    return analogue_channels[channel_id].get('device', (channel_id - 1) // CHANNELS_PER_DEVICE)
+
+
+class SimulatedADS1115:
+    """
+    Simulated ADS1115 analogue to digital convertor, a conversion takes 1/data_rate seconds during which the
+    simulated I2C bus is free for the other devices. The voltage of each pin can be set with set_voltage.
+    """
+    def __init__(self, address, data_rate):
+        self.address = address
+        self.data_rate = data_rate
+        self.conversions = 0
+        self._voltages = [0.5 * (pin + 1) for pin in range(CHANNELS_PER_DEVICE)]
+
+    def set_voltage(self, pin, voltage):
+        """Sets the voltage applied to a pin."""
+        self._voltages[pin] = voltage
+
+    def read(self, pin):
+        """Single shot conversion of a pin: write the config register, wait for the conversion, read the result."""
+        with SIMULATED_BUS:
+            sleep(SIMULATED_TRANSFER)
+        sleep(1 / self.data_rate)
+        with SIMULATED_BUS:
+            sleep(SIMULATED_TRANSFER)
+            self.conversions += 1
+            return self._voltages[pin]
+
+
+class SimulatedAnalogIn:  # pylint: disable=too-few-public-methods
+    """AnalogIn for a pin of a SimulatedADS1115."""
+    def __init__(self, device, pin):
+        self._device = device
+        self._pin = pin
+
+    @property
+    def voltage(self):
+        """The voltage of the pin."""
+        return self._device.read(self._pin)
 
-ADC_DEVICE = None
 
 def init_analogue():
     """
     Initializes the analogue interface by setting up the I2C connection and
-    checking for the presence of the analogue to digital converter (ADC).
+    checking for the presence of the analogue to digital converters (ADC).
 
     This function determines if the analogue interface is installed and operational.
-    It scans for connected I2C devices and logs whether the analogue to digital
-    converter (ADC) is successfully connected at the specified address.
-    If the ADC is not found, the 'analogue_installed' setting is updated to False,
+    It scans for connected I2C devices and connects each ADC listed in
+    'analogue_devices' that is found, or creates simulated ADCs if 'analogue_simulate'
+    is set. If no ADC is found, the 'analogue_installed' setting is updated to False,
     and a warning is logged.
 
     """
-    if settings['analogue_installed']:
-        global ADC_DEVICE
-        i2c = board.I2C()
-        output = i2c.scan()
-        if len(output) > 0:
-            logger.info('i2c device found at address: %s', output)
-            if settings['analogue_i2c'] in output:
-                ADC_DEVICE = ADS1115(i2c, address=settings['analogue_i2c'])
-                logger.info('Analogue to digital convertor connected')
-                return
-        settings['analogue_installed'] = False
+    global DEVICE_SETTINGS
+    if not settings['analogue_installed']:
+        return
+    addresses = analogue_device_addresses()
+    DEVICE_SETTINGS = (list(addresses), settings['analogue_data_rate'], settings['analogue_simulate'])
+    if settings['analogue_simulate']:
+        for index, address in enumerate(addresses):
+            ADC_DEVICES[index] = SimulatedADS1115(address, settings['analogue_data_rate'])
+        logger.info('Analogue to digital convertors simulated at addresses: %s', addresses)
+        return
+    # the board libraries are loaded when the convertors are first connected, which may be after a reload
+    import board  # pylint: disable=import-outside-toplevel
+    from adafruit_ads1x15.ads1115 import ADS1115  # pylint: disable=import-outside-toplevel
+    i2c = board.I2C()
+    output = i2c.scan()
+    if len(output) > 0:
+        logger.info('i2c device found at address: %s', output)
+    for index, address in enumerate(addresses):
+        if address in output:
+            ADC_DEVICES[index] = ADS1115(i2c, address=address, data_rate=settings['analogue_data_rate'])
+            logger.info('Analogue to digital convertor %d connected at address %s', index + 1, hex(address))
+        else:
+            logger.warning('Analogue to digital convertor %d not found at address %s', index + 1, hex(address))
+    if not ADC_DEVICES:
+        with settings_update() as new_settings:
+            new_settings['analogue_installed'] = False
         logger.warning('Analogue to digital convertor not found')
 
 
-def check_analogue_key(item):
+def analogue_input(device, pin):
+    """Returns the AnalogIn object for a pin of a device."""
+    if isinstance(device, SimulatedADS1115):
+        return SimulatedAnalogIn(device, pin)
+    from adafruit_ads1x15.analog_in import AnalogIn  # pylint: disable=import-outside-toplevel
+    return AnalogIn(device, pin)
+
+
+class AnalogueSampler:
+    """
+    Samples the enabled analogue channels and caches the averaged readings, with one thread per device.
+    """
+    def __init__(self, devices):
+        self._readings = {}
+        self._stop = Event()
+        self._inputs = {index: {} for index in devices}
+        for channel_id, channel in analogue_channels.items():
+            if channel['enabled']:
+                index = channel_device(channel_id)
+                if index in devices:
+                    self._inputs[index][channel_id] = analogue_input(devices[index], channel['pin'])
+                else:
+                    logger.warning('Analogue channel %d: analogue to digital convertor %d not connected',
+                                   channel_id, index + 1)
+        first_samples = []
+        for index, inputs in self._inputs.items():
+            first_samples.append(Event())
+            sampler_thread = Thread(target=self.sampler, args=(inputs, first_samples[-1]), daemon=True)
+            sampler_thread.name = 'Analogue sampler %d' % (index + 1)
+            sampler_thread.start()
+        for first_sample in first_samples:
+            first_sample.wait(timeout=5)
+
+    def sample(self, inputs):
+        """
+        Takes 'analogue_oversample' conversions of each channel of a device and stores the average with the time.
+        The batch is also converted to engineering units if the channel is calibrated.
+        """
+        oversample = max(int(settings['analogue_oversample']), 1)
+        for channel_id, analogue_in in inputs.items():
+            batch = [analogue_in.voltage for _ in range(oversample)]
+            reading = {'value': sum(batch) / oversample, 'timestamp': time(), 'samples': oversample}
+            calibration = analogue_calibrations[channel_id]
+            if calibration:
+                reading['calibrated'] = float(calibration.apply(batch).mean())
+                reading['units'] = calibration.units
+            self._readings[channel_id] = reading
+
+    def sampler(self, inputs, first_sample):
+        """
+        Background loop sampling the channels of a device every 'analogue_sample_interval' seconds, first_sample
+        is set once the first readings are stored.
+        """
+        while not self._stop.is_set():
+            try:
+                self.sample(inputs)
+            except (OSError, ValueError):
+                logger.exception('Analogue sampler: error reading the analogue to digital convertor')
+            first_sample.set()
+            self._stop.wait(settings['analogue_sample_interval'])
+
+    def stop(self):
+        """Stops the sampler threads after their current sample."""
+        self._stop.set()
+
+    def reading(self, channel_id):
+        """
+        Returns the latest reading of a channel as a dict of value (volts), timestamp, samples and, for calibrated
+        channels, the calibrated value and its units.
+        """
+        return self._readings.get(channel_id, {'value': '', 'timestamp': 0.0, 'samples': 0})
+
+
+def start_sampler():
+    """
+    Starts the analogue sampler if an analogue to digital convertor is installed.
+    """
+    global SAMPLER
+    if settings['analogue_installed'] and ADC_DEVICES:
+        SAMPLER = AnalogueSampler(ADC_DEVICES)
+        logger.info('Analogue sampler started at %s samples per second, %s samples per reading',
+                    settings['analogue_data_rate'], settings['analogue_oversample'])
+
+
+def reload_analogue():
+    """
+    Applies changed analogue settings without a restart: the sampler is stopped, the channel map and
+    calibrations are rebuilt, the devices are reconnected if their addresses, data rate or simulation setting
+    changed, and a new sampler is started.
     """
-    Check if the given item matches a digital key based on a predefined prefix.
+    if SAMPLER is not None:
+        SAMPLER.stop()
+    build_analogue_channels()
+    if DEVICE_SETTINGS != (list(analogue_device_addresses()), settings['analogue_data_rate'],
+                           settings['analogue_simulate']):
+        ADC_DEVICES.clear()
+        init_analogue()
+    start_sampler()
+    register_calibrations()
+    logger.info('Analogue channels reloaded')
 
-    This function iterates through a range of identifiers and checks if the
-    provided item matches a specific format comprising a digital prefix and an
-    identifier value. If a match is found, it returns True. Otherwise, it
-    returns False.
 
+def channel_values(channel_id):
     """
-    for item_id in range(1, 5):
-        if item == '%s%d' % (settings['analogue_prefix'], item_id):
-            return True
-    return False
+    Returns the API values of a channel reading: value and volts are the voltage, calibrated channels add the
+    calibrated value and its units.
+    """
+    reading = SAMPLER.reading(channel_id)
+    values = {'value': reading['value'], 'volts': reading['value'], 'timestamp': reading['timestamp']}
+    if 'calibrated' in reading:
+        values['calibrated'] = reading['calibrated']
+        values['units'] = reading['units']
+    return values
+
 
 def analogue_single_channel(item, command):
     """
@@ -76,12 +291,10 @@ def analogue_single_channel(item, command):
         return {'status': 'error'}
     intchannel = int(item[len(settings['analogue_prefix']):])
     if analogue_channels[intchannel]['enabled']:
-        #pylint: disable=used-before-assignment
-        chan = AnalogIn(ADC_DEVICE, analogue_channels[intchannel]['pin'])
-        voltage = chan.voltage
+        values = channel_values(intchannel)
+        values['%s' % settings['analogue_prefix']] = intchannel
         return {'item': item, 'command': command, 'values': {'%s%d' % (settings['analogue_prefix'], intchannel):
-                                                                 {'value': voltage,
-                                                                  '%s' % settings['analogue_prefix']: intchannel }}}
+                                                                 values}}
     logger.warning('Analogue channel %d not enabled',intchannel)
     return {'item': item, 'command': command, 'values': {'%s%d' % (settings['analogue_prefix'], intchannel):
                                                              {'value': '',}}, 'exception': 'Channel not enabled'}
@@ -101,13 +314,37 @@ def analogue_all_values(item, command, log_error=True):
             logger.warning('Analogue to digital convertor not installed')
         return {'item': item, 'command': command, 'values': '', 'exception': 'ADC not installed'}
     values = {}
-    for i in range(1, 5):
-        if analogue_channels[i]['enabled']:
-            chan = AnalogIn(ADC_DEVICE, analogue_channels[i]['pin'])
-            voltage = chan.voltage
-            values['%s%d' % (settings['analogue_prefix'], i)] = {'value': voltage, '%s' % settings['analogue_prefix']: i,
-                                                             'enabled': analogue_channels[i]['enabled'],
-                                                             'name': analogue_channels[i]['name']}
+    for i, analogue_channel in analogue_channels.items():
+        if analogue_channel['enabled']:
+            channel = channel_values(i)
+            channel.update({'%s' % settings['analogue_prefix']: i, 'enabled': analogue_channel['enabled'],
+                            'name': analogue_channel['name']})
+            values['%s%d' % (settings['analogue_prefix'], i)] = channel
     return {'item': item, 'command': command, 'values': values}
 
+
+def record_analogue_values():
+    """
+    Records the voltage of every enabled analogue channel in the data store, and the calibrated value of the
+    calibrated channels as a series of its own, registered as a data store sampler.
+    """
+    if settings['analogue_installed']:
+        for name, channel in analogue_all_values(False, False, False)['values'].items():
+            data_store.record(name, channel['value'])
+            if 'calibrated' in channel:
+                data_store.record(name + CALIBRATED_SUFFIX, channel['calibrated'])
+
+
+def register_calibrations():
+    """
+    Registers each calibrated channel with the data store so its stored calibrated history can be queried in
+    engineering units.
+    """
+    for channel_id, calibration in analogue_calibrations.items():
+        if calibration:
+            data_store.register_calibrated('%s%d' % (settings['analogue_prefix'], channel_id), calibration.units)
+
 init_analogue()
+start_sampler()
+data_store.register_sampler(record_analogue_values)
+register_calibrations()
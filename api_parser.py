@@ -10,23 +10,108 @@ the parsing process.
 
 Functions:
     parsecontrol: Process API control commands and return appropriate responses
+    parse_batch: Process a list of API control commands in one request
+    build_dispatch: Build the item to handler dispatch index used by parsecontrol
 
 Dependencies:
     app_control: For accessing and writing application settings
     logmanager: For logging activities and errors
 """
 
+from time import perf_counter
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
 from app_control import settings
-from config_class import (set_appname, get_netifo, set_netinfo, updatesetting, restart_services,
-                          set_analogue_settings, set_digital_settings)
-from digital_class import digital_all_values, check_digital_key, digital_single_channel
-from analogue_class import analogue_all_values, check_analogue_key, analogue_single_channel
+from config_class import (set_appname, get_netifo, set_netinfo, updatesetting, set_analogue_settings,
+                          set_digital_settings)
+from digital_class import digital_all_values, digital_single_channel, digital_set, digital_channels
+from analogue_class import analogue_all_values, analogue_single_channel, analogue_channels
 from serial_class import (update_serial_channel, update_serial_message, delete_serial_message,
-                          serial_http_data, serial_api_checker, serial_api_parser)
+                          serial_http_data, serial_api_parser, serial_api_checker, serial_channels)
+from datastore_class import datastore_api
+from sequence_class import sequence_api
+from interlock_class import interlocks
+from trie_class import PrefixTrie
 from logmanager import logger
 from custom_api import custom_api, custom_parser
+from reload_class import reloading
+
+BATCH_LOCK = Lock()  # held by stop_on_error batches so they do not interleave with each other
+BATCH_WORKERS = 8
+
+
+@reloading
+def set_oled_command(_, command):
+    """Enables or disables the OLED display, the change is applied by reload_class."""
+    if 'oled-enabled' in command.keys():
+        updatesetting({'oled_enabled': True})
+    else:
+        updatesetting({'oled_enabled': False})
+    return {'success': 'settings applied'}
+
+
+@reloading
+def update_setting_command(_, command):
+    """Updates settings from a dict, the changed settings are applied by reload_class."""
+    updatesetting(command)
+    return settings
+
+
+def set_netinfo_command(_, command):
+    """Sets the network configuration from the network settings form."""
+    return set_netinfo(command['ipv4.method'], command['IP4.ADDRESS'], command['IP4.SUBNET'],
+                       command['IP4.GATEWAY'], command['IP4.DNS'])
+
+
+DISPATCH = {'exact': {}, 'prefix': PrefixTrie()}
+RELOAD_ITEMS = ('digital_settings', 'analogue_settings', 'updatesetting', 'update_serial_channel')
+
+
+def build_dispatch():
+    """
+    Builds the dispatch index used by parsecontrol: a dict of the items matched exactly and a PrefixTrie of the
+    digital channel and serial channel names, which are followed by a suffix. Must be called again whenever the
+    digital or analogue prefix or the serial channels change. The new index replaces the old one in a single
+    assignment so a parsecontrol running at the same time sees one or the other.
+    """
+    digital_prefix = settings['digital_prefix']
+    analogue_prefix = settings['analogue_prefix']
+    # the prefixed items come first so the status page items below keep their handlers when the prefixes are
+    # 'digital' and 'analogue'
+    exact = {'%sstatus' % digital_prefix: digital_all_values,
+             '%sset' % digital_prefix: digital_set,
+             '%sstatus' % analogue_prefix: analogue_all_values,
+             'serialstatus': lambda item, command: serial_http_data(False, False),
+             'digitalstatus': lambda item, command: digital_all_values(False, False),
+             'analoguestatus': lambda item, command: analogue_all_values(False, False, command),
+             'datastore': datastore_api,
+             'sequence': sequence_api,
+             'interlocks': interlocks.info,
+             'getnetinfo': lambda item, command: get_netifo(),
+             'update_serial_channel': reloading(lambda item, command: update_serial_channel(command)),
+             'update_serial_message': reloading(lambda item, command: update_serial_message(command)),
+             'delete_serial_message': reloading(lambda item, command: delete_serial_message(command)),
+             'setnetinfo': set_netinfo_command,
+             'setappname': lambda item, command: set_appname(command),
+             'set_oled': set_oled_command,
+             'updatesetting': update_setting_command,
+             'getsettings': lambda item, command: settings,
+             'analogue_settings': reloading(lambda item, command: set_analogue_settings(command)),
+             'digital_settings': reloading(lambda item, command: set_digital_settings(command))}
+    for channel in analogue_channels:
+        exact['%s%d' % (analogue_prefix, channel)] = analogue_single_channel
+    for item in custom_api:
+        exact[item] = custom_parser
+    prefix = PrefixTrie()
+    for channel in digital_channels:
+        prefix.insert('%s%d' % (digital_prefix, channel), digital_single_channel)
+    for channel_name in serial_channels:
+        prefix.insert(channel_name, serial_api_parser)
+    DISPATCH['exact'], DISPATCH['prefix'] = exact, prefix
+    logger.debug('API Parser: dispatch index built, %d items and %d prefixes', len(exact),
+                 len(digital_channels) + len(serial_channels))
+
 
-# pylint: disable=too-many-return-statements
 def parsecontrol(item, command):
     """
     Processes the given command for a specific item and returns the result of the operation.
@@ -36,65 +121,139 @@ def parsecontrol(item, command):
     channel states, retrieving or setting network information, updating settings, managing OLED status,
     and much more. If an unknown item or command is provided, it logs the issue and responds
     with an error message.
+
+    The handler is found with one dict lookup for exact items, or one walk of the prefix trie for
+    digital and serial items, see build_dispatch.
     """
     try:
-        if item in custom_api:
-            return custom_parser(item, command)
-        if item == 'serialstatus':
-            return serial_http_data(False, False)
-        if item == 'digitalstatus':
-            return digital_all_values(False, False)
-        if item == 'analoguestatus':
-            return analogue_all_values(False, False, command)
-        if check_digital_key(item):  # read status of a digital channel
-            return digital_single_channel(item, command)
-        if item == '%sstatus' % settings['digital_prefix']:
-            return digital_all_values(item, command)
-        if check_analogue_key(item):  # read status of an analogue channel
-            return analogue_single_channel(item, command)
-        if item == '%sstatus' % settings['analogue_prefix']:
-            return analogue_all_values(item, command)
-        if serial_api_checker(item):
-            return serial_api_parser(item, command)
-        if item == 'getnetinfo':
-            return get_netifo()
-        if item == 'update_serial_channel':
-            return update_serial_channel(command)
-        if item == 'update_serial_message':
-            return update_serial_message(command)
-        if item == 'delete_serial_message':
-            return delete_serial_message(command)
-        if item == 'setnetinfo':
-            mode = command['ipv4.method']
-            ip_addr = command['IP4.ADDRESS']
-            nwclass = command['IP4.SUBNET']
-            df_gw = command['IP4.GATEWAY']
-            dns_server = command['IP4.DNS']
-            return set_netinfo(mode, ip_addr, nwclass, df_gw, dns_server)
-        if item == 'setappname':
-            return set_appname(command)
-        if item == 'set_oled':
-            if 'oled-enabled' in command.keys():
-                updatesetting({'oled_enabled': True})
-            else:
-                updatesetting({'oled_enabled': False})
-            restart_services()
-            return {'success': 'services restarted'}
-        if item == 'updatesetting':
-            updatesetting(command)
-            restart_services()
-            return settings
-        if item == 'getsettings':
-            return settings
-        if item == 'analogue_settings':
-            return set_analogue_settings(command)
-        if item == 'digital_settings':
-            return set_digital_settings(command)
-        logger.warning('unknown item %s command %s', item, command)
-        return {'error': 'unknown api command'}
+        handler = DISPATCH['exact'].get(item)
+        if handler is None and isinstance(item, str):
+            handler = DISPATCH['prefix'].longest_prefix(item)
+        if handler is None:
+            logger.warning('unknown item %s command %s', item, command)
+            return {'error': 'unknown api command'}
+        result = handler(item, command)
+        if item in RELOAD_ITEMS:
+            build_dispatch()
+        return result
     except ValueError:
         logger.error('API Parser incorrect json message, value error')
         return {'error': 'bad value in json message'}
     except IndexError:
         logger.error('API Parser incorrect json message, index error')
         return {'error': 'Bad index in json message'}
+
+
+def timed_command(api_command):
+    """
+    Runs a single {'item': item, 'command': command} api command from a batch and returns the result with the time
+    taken in milliseconds.
+    """
+    start = perf_counter()
+    try:
+        result = parsecontrol(api_command['item'], api_command['command'])
+    except (KeyError, TypeError):
+        result = {'error': 'badly formed command in batch'}
+    return {'item': api_command.get('item') if isinstance(api_command, dict) else None, 'result': result,
+            'time_ms': round((perf_counter() - start) * 1000, 3)}
+
+
+def command_failed(result):
+    """Checks whether the result of an api command reports an error or exception."""
+    return isinstance(result, dict) and ('error' in result or 'exception' in result)
+
+
+def parse_batch(commands, ordered=True, stop_on_error=False):
+    """
+    Processes a list of {'item': item, 'command': command} api commands in one request and returns a list of
+    results, in the same order as the commands, each with the time taken in milliseconds.
+
+    ordered: run the commands one after another in the order given, if False they are run concurrently
+    stop_on_error: run the commands in order and stop at the first command that fails, the remaining commands
+        are returned as skipped. The batch lock is held so other stop_on_error batches do not interleave with it,
+        single commands and other batches still can. Commands that have already run are not undone.
+    """
+    if not isinstance(commands, list):
+        return {'error': 'batch commands must be a list'}
+    if not isinstance(ordered, bool) or not isinstance(stop_on_error, bool):
+        return {'error': 'batch ordered and stop_on_error must be true or false'}
+    start = perf_counter()
+    if stop_on_error:
+        results = []
+        with BATCH_LOCK:
+            for api_command in commands:
+                if results and command_failed(results[-1]['result']):
+                    results.append({'item': api_command.get('item') if isinstance(api_command, dict) else None,
+                                    'result': {'error': 'skipped, an earlier command in the batch failed'},
+                                    'time_ms': 0.0})
+                else:
+                    results.append(timed_command(api_command))
+    elif ordered or len(commands) < 2:
+        results = [timed_command(api_command) for api_command in commands]
+    else:
+        with ThreadPoolExecutor(max_workers=min(len(commands), BATCH_WORKERS)) as executor:
+            results = list(executor.map(timed_command, commands))
+    logger.debug('API batch of %d commands in %.1f ms', len(commands), (perf_counter() - start) * 1000)
+    return {'batch': results, 'time_ms': round((perf_counter() - start) * 1000, 3)}
+
+
+build_dispatch()
+
+
+if __name__ == '__main__':
+    # micro-benchmark of the dispatch index against the chain of if tests it replaced
+    from timeit import timeit
+
+    def check_digital_key(item):
+        """The digital channel test of the if chain, an item starting with the prefix and a channel number."""
+        for item_id in range(16, 0, -1):
+            digital_prefix = '%s%d' % (settings['digital_prefix'], item_id)
+            if item[:len(digital_prefix)] == digital_prefix:
+                return True
+        return False
+
+    def check_analogue_key(item):
+        """The analogue channel test of the if chain, an item equal to the prefix and a channel number."""
+        for item_id in analogue_channels:
+            if item == '%s%d' % (settings['analogue_prefix'], item_id):
+                return True
+        return False
+
+    def chain_lookup(item):
+        """The item resolution of the if chain parsecontrol used before the dispatch index."""
+        # pylint: disable=too-many-return-statements
+        if item in custom_api:
+            return custom_parser
+        if item in ('serialstatus', 'digitalstatus', 'analoguestatus'):
+            return item
+        if check_digital_key(item):
+            return digital_single_channel
+        if item == '%sstatus' % settings['digital_prefix']:
+            return digital_all_values
+        if check_analogue_key(item):
+            return analogue_single_channel
+        if item == '%sstatus' % settings['analogue_prefix']:
+            return analogue_all_values
+        if serial_api_checker(item):
+            return serial_api_parser
+        for name in ('datastore', 'getnetinfo', 'update_serial_channel', 'update_serial_message',
+                     'delete_serial_message', 'setnetinfo', 'setappname', 'set_oled', 'updatesetting',
+                     'getsettings', 'analogue_settings', 'digital_settings'):
+            if item == name:
+                return name
+        return None
+
+    def dispatch_lookup(item):
+        """The item resolution of the dispatch index."""
+        handler = DISPATCH['exact'].get(item)
+        if handler is None:
+            handler = DISPATCH['prefix'].longest_prefix(item)
+        return handler
+
+    test_items = ['digitalstatus', '%s1' % settings['digital_prefix'], '%s16-pwm' % settings['digital_prefix'],
+                  '%s3' % settings['analogue_prefix'], 'getsettings', 'digital_settings', 'unknown-item']
+    test_items += ['%sstatus' % name for name in serial_channels]
+    for test_item in test_items:
+        chain_time = timeit(lambda item=test_item: chain_lookup(item), number=20000) / 20000 * 1e6
+        dispatch_time = timeit(lambda item=test_item: dispatch_lookup(item), number=20000) / 20000 * 1e6
+        print('%-24s chain %7.2f us   dispatch %7.2f us' % (test_item, chain_time, dispatch_time))
@@ -14,25 +14,28 @@ various endpoints for both web interface and programmatic access.
 Routes:
     / : Main status page
     /statusdata : JSON endpoint for live status updates
+    /stream : Server-Sent Events stream of status updates
     /api : Protected API endpoint for system control
     /pylog : Application log viewer
     /guaccesslog : Gunicorn access log viewer
     /guerrorlog : Gunicorn error log viewer
     /syslog : System log viewer
+    /logsearch : Search of the application and Gunicorn logs
 
 Authentication:
     API endpoints require a valid API key passed in the 'Api-Key' header.
 """
-import subprocess
+import time
 from threading import enumerate as enumerate_threads, Timer
 from datetime import datetime
-from flask import Flask, render_template, jsonify, request, redirect, session, url_for, send_file
+from flask import Flask, render_template, jsonify, request, redirect, session, url_for, send_file, Response
 from simplepam import authenticate
 from app_control import VERSION, API_KEY, settings
-from logmanager import logger
+from logmanager import logger, read_log_page, search_log, read_journal
 from oled_class import set_oled
-from api_parser import parsecontrol
+from api_parser import parsecontrol, parse_batch
 from serial_class import serial_ports, serial_port_info
+from status_class import status_aggregator, read_cpu_temperature
 
 app = Flask(__name__)
 app.secret_key = API_KEY
@@ -43,17 +46,11 @@ oledthread.start()
 
 
 def read_log_from_file(file_path):
-    """Read a log from a file and reverse the order of the lines so newest is at the top"""
-    with open(file_path, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-    return list(reversed(lines))
-
-
-def read_cpu_temperature():
-    """Read the CPU temperature and returns in in Celcius"""
-    with open(settings['cputemp'], 'r', encoding='utf-8') as f:
-        log = f.readline()
-    return round(float(log) / 1000, 1)
+    """Read a page of a log with the newest line at the top, the page is selected by the ?before=<cursor>&limit=
+    request arguments. Returns the lines, the cursor of the next older page and the page length"""
+    limit = max(request.args.get('limit', settings['log_page_lines'], type=int), 1)
+    lines, cursor = read_log_page(file_path, request.args.get('before', ''), limit)
+    return lines, cursor, limit
 
 
 def threadlister():
@@ -67,22 +64,27 @@ def threadlister():
 @app.route('/')
 def index():
     """Main web status page"""
+    status = status_aggregator.snapshot().status
+    no_status = {'values': {}}  # until the first snapshot has been taken
     return render_template('index.html', version=VERSION, settings=settings,
                            threads=threadlister(), year=YEAR,
-                           digital_status=parsecontrol('digitalstatus', False),
-                           analogue_status=parsecontrol('analoguestatus', False),
-                           serial_status=parsecontrol('serialstatus', False))
+                           digital_status=status.get('digital_status', no_status),
+                           analogue_status=status.get('analogue_status', no_status),
+                           serial_status=status.get('serial_status', no_status))
 
 
 @app.route('/statusdata', methods=['GET'])
 def statusdata():
-    """Status data read by javascript on default website so the page shows near live values"""
-    ctrldata = {'cputemperature': read_cpu_temperature(),
-                'digital_status': parsecontrol('digitalstatus', False),
-                'analogue_status': parsecontrol('analoguestatus', False),
-                'serial_status': parsecontrol('serialstatus', False)
-                }
-    return jsonify(ctrldata), 201
+    """Status data read by javascript on default website so the page shows near live values, served from the shared
+    status snapshot with its sequence number and age"""
+    return Response(status_aggregator.snapshot_json(), mimetype='application/json'), 201
+
+
+@app.route('/stream')
+def stream():
+    """Server-Sent Events stream of the status data, a message is sent only when the status changes"""
+    return Response(status_aggregator.events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @app.route('/api', methods=['POST'])
@@ -94,6 +96,11 @@ def api():
         logger.debug('API request: %s', request.json)
         if 'Api-Key' in request.headers.keys():  # check api key exists
             if request.headers['Api-Key'] == API_KEY:  # check for correct API key
+                if isinstance(request.json, list):  # batch of commands
+                    return jsonify(parse_batch(request.json)), 201
+                if 'batch' in request.json:  # batch of commands with options
+                    return jsonify(parse_batch(request.json['batch'], request.json.get('ordered', True),
+                                               request.json.get('stop_on_error', False))), 201
                 item = request.json['item']
                 command = request.json['command']
                 return jsonify(parsecontrol(item, command)), 201
@@ -154,6 +161,8 @@ def config():
             parsecontrol('digital_settings', request.form)
         elif request.form['form-name'] == 'loglevel':
             parsecontrol('updatesetting', {'loglevel': request.form['loglevel']})
+        elif request.form['form-name'] == 'serialengine':
+            parsecontrol('updatesetting', {'serial_engine': request.form['serial_engine']})
         else:
             logger.warning('config request: key not handled %s', request.form)
     set_oled()
@@ -205,8 +214,8 @@ def download_manual():
 def showplogs():
     """Show the Application log web page"""
     cputemperature = read_cpu_temperature()
-    logs = read_log_from_file(settings['logfilepath'])
-    return render_template('logs.html', rows=logs, log='Application log',
+    logs, cursor, limit = read_log_from_file(settings['logfilepath'])
+    return render_template('logs.html', rows=logs, log='Application log', cursor=cursor, limit=limit,
                            cputemperature=cputemperature, settings=settings, version=VERSION, year=YEAR)
 
 
@@ -214,8 +223,8 @@ def showplogs():
 def showgalogs():
     """"Show the Gunicorn Access Log web page"""
     cputemperature = read_cpu_temperature()
-    logs = read_log_from_file(settings['gunicornpath'] + 'gunicorn-access.log')
-    return render_template('logs.html', rows=logs, log='Gunicorn Access Log',
+    logs, cursor, limit = read_log_from_file(settings['gunicornpath'] + 'gunicorn-access.log')
+    return render_template('logs.html', rows=logs, log='Gunicorn Access Log', cursor=cursor, limit=limit,
                            cputemperature=cputemperature, settings=settings, version=VERSION, year=YEAR)
 
 
@@ -223,21 +232,43 @@ def showgalogs():
 def showgelogs():
     """"Show the Gunicorn Errors Log web page"""
     cputemperature = read_cpu_temperature()
-    logs = read_log_from_file(settings['gunicornpath'] + 'gunicorn-error.log')
-    return render_template('logs.html', rows=logs, log='Gunicorn Error Log',
+    logs, cursor, limit = read_log_from_file(settings['gunicornpath'] + 'gunicorn-error.log')
+    return render_template('logs.html', rows=logs, log='Gunicorn Error Log', cursor=cursor, limit=limit,
                            cputemperature=cputemperature, settings=settings, version=VERSION, year=YEAR)
 
 
+def search_time(arg_name):
+    """Converts a datetime-local form value (YYYY-MM-DDTHH:MM) request argument to epoch seconds, None if not set"""
+    value = request.args.get(arg_name, '')
+    try:
+        return time.mktime(time.strptime(value, '%Y-%m-%dT%H:%M'))
+    except ValueError:
+        return None
+
+
+@app.route('/logsearch')
+def searchlogs():
+    """Search the application or gunicorn logs, including the rotated backups, by words, level and time range"""
+    cputemperature = read_cpu_temperature()
+    log_paths = {'app': settings['logfilepath'],
+                 'access': settings['gunicornpath'] + 'gunicorn-access.log',
+                 'error': settings['gunicornpath'] + 'gunicorn-error.log'}
+    log_path = log_paths.get(request.args.get('log', 'app'), settings['logfilepath'])
+    limit = max(request.args.get('limit', settings['log_page_lines'], type=int), 1)
+    logs = search_log(log_path, request.args.get('text', ''), request.args.get('level', ''),
+                      search_time('start'), search_time('end'), limit)
+    return render_template('logs.html', rows=logs, log='Log Search', cputemperature=cputemperature,
+                           settings=settings, version=VERSION, year=YEAR)
+
+
 @app.route('/syslog')
 def showslogs():
-    """Show the last 2000 lines from the system log on a web page"""
+    """Show a page of the system log on a web page, newest first, paged with ?before=<journal cursor>&limit="""
     cputemperature = read_cpu_temperature()
-    log = subprocess.Popen('/bin/journalctl -n 2000', shell=True,
-                           stdout=subprocess.PIPE).stdout.read().decode(encoding='utf-8')
-    logs = log.split('\n')
-    logs.reverse()
-    return render_template('logs.html', rows=logs, log='System Log', cputemperature=cputemperature,
-                            settings=settings, version=VERSION, year=YEAR)
+    limit = max(request.args.get('limit', settings['log_page_lines'], type=int), 1)
+    logs, cursor = read_journal(request.args.get('before', ''), limit)
+    return render_template('logs.html', rows=logs, log='System Log', cursor=cursor, limit=limit,
+                           cputemperature=cputemperature, settings=settings, version=VERSION, year=YEAR)
 
 
 if __name__ == '__main__':
@@ -14,6 +14,19 @@ Attributes:
         - logfilepath (str): Path to application log file
         - gunicornpath (str): Base directory for Gunicorn log files
 
+Settings are saved by writesettings(), writes made within 'settings_write_delay' seconds of
+each other are combined into one. The file is written to a temporary file that is then renamed
+over settings.json, so a power cut leaves either the old or the new file and never a truncated
+one. With 'settings_journal' set, the changed settings are appended to settings.journal instead
+of rewriting the whole file, and the journal is compacted into settings.json after
+'settings_journal_max' entries and at start up.
+
+Every saved change also publishes a new SettingsSnapshot: a read only copy of the settings
+with a version number, replaced in one assignment. Code that reads several settings, or reads
+them in a loop, takes current_settings() once and uses that, without locking, and sees either
+all or none of a change. settings_update() applies a group of changes to a copy of the settings
+and only copies them back and publishes them if the whole group succeeds.
+
 Note:
     This module is a central configuration point for the application and should
     be imported by other modules that need access to global settings or version
@@ -21,14 +34,35 @@ Note:
 
 """
 
+import os
 import random
 import json
+import atexit
+from copy import deepcopy
+from collections import namedtuple
+from contextlib import contextmanager
+from types import MappingProxyType
+from threading import Timer, Lock, RLock
 from base64 import b64decode, b64encode
 from datetime import datetime
 from custom_settings import custom_settings
 
-VERSION = '1.4.3'
+VERSION = '1.5.24'
 API_KEY=''
+SETTINGS_FILE = 'settings.json'
+SETTINGS_JOURNAL = 'settings.journal'
+SETTINGS_LOCK = Lock()
+WRITE_TIMER = None
+SAVED_SETTINGS = {}  # JSON text of each setting as it was last saved, to find the changed settings
+JOURNAL_ENTRIES = 0
+UPDATE_LOCK = RLock()  # held while the settings are changed by settings_update or copied into a snapshot
+
+SettingsSnapshot = namedtuple('SettingsSnapshot', ['version', 'values'])
+"""
+version: increases by one for every snapshot published\n
+values: read only mapping of the settings, nested dicts are read only mappings and lists are tuples
+"""
+SETTINGS_SNAPSHOT = SettingsSnapshot(0, MappingProxyType({}))
 
 def initialise():
     """Setup the settings dict structure with default values"""
@@ -38,6 +72,9 @@ def initialise():
                  'oled_address': 0x3C,
                  'oled_height': 64,
                  'oled_width': 128,
+                 'oled_refresh_interval': 1,
+                 'oled_valves': True,
+                 'oled_values': [],
                  'app-name': 'TST Controller',
                  'cputemp': '/sys/class/thermal/thermal_zone0/temp',
                  'gunicornpath': './logs/',
@@ -49,6 +86,10 @@ def initialise():
                  'digital_on_command': '1',
                  'digital_off_value': '0',
                  'digital_off_command': '0',
+                 'digital_edge_history': 32,
+                 'digital_verify_interval': 0,
+                 'sequences': {},
+                 'interlocks': [],
                  'digital_channels': {
                  '1': {'name': 'Digital 1', 'gpio': 26, 'direction': 'output', 'enabled': True, 'excluded': '0',
                         'pwm': 50, 'frequency': 500},
@@ -85,13 +126,33 @@ def initialise():
                  'analogue_prefix': 'analogue',
                  'analogue_installed': False,
                  'analogue_i2c': 0x48,
+                 'analogue_devices': [],
+                 'analogue_simulate': False,
+                 'analogue_data_rate': 128,
+                 'analogue_oversample': 8,
+                 'analogue_sample_interval': 0.5,
                  'analogue_channels': {
                  '1': {'name': 'Analogue 1', 'pin': 0, 'enabled': False},
                  '2': {'name': 'Analogue 2', 'pin': 1, 'enabled': False},
                  '3': {'name': 'Analogue 3', 'pin': 2, 'enabled': False},
                  '4': {'name': 'Analogue 4', 'pin': 3, 'enabled': False}},
                  'serial_channels': [],
-                 'serial_debug': False
+                 'serial_debug': False,
+                 'serial_engine': 'thread',
+                 'serial_history_length': 3600,
+                 'datastore_enabled': True,
+                 'datastore_path': './data/history.db',
+                 'datastore_sample_interval': 10,
+                 'datastore_flush_interval': 60,
+                 'datastore_retention': {'raw': 2, '1m': 30, '1h': 730},
+                 'status_interval': 1,
+                 'stream_heartbeat': 15,
+                 'log_page_lines': 500,
+                 'journal_cache_ttl': 5,
+                 'netinfo_cache_ttl': 30,
+                 'settings_write_delay': 2,
+                 'settings_journal': False,
+                 'settings_journal_max': 100
                  }
     isettings.update(custom_settings)
     return isettings
@@ -103,21 +164,135 @@ def generate_api_key(key_len):
     return ''.join(random.choice(allowed_characters) for _ in range(key_len))
 
 
+def freeze(value):
+    """Returns a read only copy of a setting value, dicts become read only mappings and lists become tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({item: freeze(item_value) for item, item_value in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item_value) for item_value in value)
+    return value
+
+def thaw(value):
+    """Returns a plain copy of a frozen setting value that can be serialised to json"""
+    if isinstance(value, MappingProxyType):
+        return {item: thaw(item_value) for item, item_value in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item_value) for item_value in value]
+    return value
+
+def publishsettings():
+    """Publish the settings as a new snapshot"""
+    global SETTINGS_SNAPSHOT
+    with UPDATE_LOCK:
+        SETTINGS_SNAPSHOT = SettingsSnapshot(SETTINGS_SNAPSHOT.version + 1, freeze(settings))
+
+def current_settings():
+    """Returns the read only mapping of the latest settings snapshot, it never changes so can be kept and used
+    without locking"""
+    return SETTINGS_SNAPSHOT.values
+
+def settings_version():
+    """Returns the version number of the latest settings snapshot"""
+    return SETTINGS_SNAPSHOT.version
+
+def applychanges(target, original, changed):
+    """Applies the differences between original and changed to target, nested dicts are updated in place so
+    references to them stay valid and values the block did not change are left as they are. Returns True if
+    anything was changed"""
+    applied = False
+    for item, value in changed.items():
+        if item in original and original[item] == value:
+            continue
+        if isinstance(value, dict) and isinstance(original.get(item), dict) and isinstance(target.get(item), dict):
+            applied = applychanges(target[item], original[item], value) or applied
+        else:
+            target[item] = value
+            applied = True
+    for item in [item for item in original if item not in changed]:
+        target.pop(item, None)
+        applied = True
+    return applied
+
+@contextmanager
+def settings_update():
+    """Context manager for a group of changes to the settings, the block changes a copy of the settings and when it
+    completes only the settings the block changed are applied, published and saved. If the block raises an
+    exception none of its changes are applied. Updates are made one at a time."""
+    with UPDATE_LOCK:
+        original = deepcopy(settings)
+        new_settings = deepcopy(original)
+        yield new_settings
+        if applychanges(settings, original, new_settings):
+            writesettings()
+
 def writesettings():
-    """Write settings to a json file"""
-    settings['LastSave'] = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
-    with open('settings.json', 'w', encoding='utf-8') as outfile:
-        json.dump(settings, outfile, indent=4, sort_keys=True)
+    """Publish the settings and write them to the json file, the write is delayed by 'settings_write_delay'
+    seconds so that the changes made in that time are saved together"""
+    global WRITE_TIMER
+    publishsettings()
+    if settings['settings_write_delay'] <= 0:
+        flushsettings()
+        return
+    with SETTINGS_LOCK:
+        if WRITE_TIMER is not None:
+            return
+        WRITE_TIMER = Timer(settings['settings_write_delay'], flushsettings)
+        WRITE_TIMER.daemon = True
+        WRITE_TIMER.start()
+
+def flushsettings():
+    """Save any changed settings now, appended to the journal if it is enabled and not full, otherwise by
+    writing the whole json file. The latest published snapshot is saved, it never changes so it is serialised
+    without holding the update lock while other threads change the settings"""
+    global WRITE_TIMER, SAVED_SETTINGS, JOURNAL_ENTRIES
+    with SETTINGS_LOCK:
+        if WRITE_TIMER is not None:
+            WRITE_TIMER.cancel()
+            WRITE_TIMER = None
+        values = thaw(current_settings())
+        current = {item: json.dumps(value, sort_keys=True) for item, value in values.items() if item != 'LastSave'}
+        changed = [item for item in current if SAVED_SETTINGS.get(item) != current[item]]
+        if SAVED_SETTINGS and not changed:
+            return
+        values['LastSave'] = settings['LastSave'] = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+        if values['settings_journal'] and SAVED_SETTINGS and JOURNAL_ENTRIES < values['settings_journal_max']:
+            entry = {item: values[item] for item in changed}
+            entry['LastSave'] = values['LastSave']
+            with open(SETTINGS_JOURNAL, 'a', encoding='utf-8') as journal:
+                journal.write(json.dumps(entry, sort_keys=True) + '\n')
+                journal.flush()
+                os.fsync(journal.fileno())
+            JOURNAL_ENTRIES += 1
+        else:
+            temp_file = SETTINGS_FILE + '.tmp'
+            with open(temp_file, 'w', encoding='utf-8') as outfile:
+                outfile.write(json.dumps(values, indent=4, sort_keys=True))
+                outfile.flush()
+                os.fsync(outfile.fileno())
+            os.replace(temp_file, SETTINGS_FILE)
+            if os.path.exists(SETTINGS_JOURNAL):
+                os.remove(SETTINGS_JOURNAL)
+            JOURNAL_ENTRIES = 0
+        SAVED_SETTINGS = current
 
 def readsettings():
-    """Read the json file"""
+    """Read the json file and apply the changes in the journal, a partly written last journal entry is ignored"""
     try:
-        with open('settings.json', 'r', encoding='utf-8') as json_file:
+        with open(SETTINGS_FILE, 'r', encoding='utf-8') as json_file:
             jsettings = json.load(json_file)
-            return jsettings
     except FileNotFoundError:
         print('File not found')
-        return {}
+        jsettings = {}
+    try:
+        with open(SETTINGS_JOURNAL, 'r', encoding='utf-8') as journal:
+            for line in journal:
+                try:
+                    jsettings.update(json.loads(line))
+                except ValueError:
+                    print('Settings journal entry not complete, ignored')
+    except FileNotFoundError:
+        pass
+    return jsettings
 
 def loadsettings():
     """Replace the default settings with those from the json files, if a setting is not in the json file (e.g. it is a
@@ -137,8 +312,9 @@ def loadsettings():
         settings['api-key'] = b64encode(generate_api_key(128).encode('utf-8')).decode('utf-8')
         API_KEY = b64decode(settings['api-key']).decode('utf-8')
         settingschanged = True
-    if settingschanged:
-        writesettings()
+    publishsettings()
+    if settingschanged or os.path.exists(SETTINGS_JOURNAL):
+        flushsettings()
 
 def friendlyname(sourcename: str) -> str:
     """
@@ -194,3 +370,4 @@ def jscriptname(sourcename: str) -> str:
 
 settings = initialise()
 loadsettings()
+atexit.register(flushsettings)
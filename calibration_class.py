@@ -0,0 +1,84 @@
+"""
+Calibration of analogue voltages into engineering units.
+
+Each analogue channel can have a 'calibration' entry in settings['analogue_channels'] that
+converts the measured voltage into the units of the instrument connected to it, e.g. the
+pressure reading of a Pirani or Penning gauge. The conversion is done with NumPy so a whole
+batch of samples or a stored history is converted in a single vectorised pass.
+
+Calibration types:
+    polynomial: {'type': 'polynomial', 'coefficients': [c0, c1, c2, ...], 'units': 'V'}
+                value = c0 + c1*V + c2*V^2 + ...
+    table:      {'type': 'table', 'volts': [v0, v1, ...], 'values': [p0, p1, ...], 'units': 'C'}
+                piecewise linear interpolation of the lookup table, volts must be increasing
+    loglinear:  {'type': 'loglinear', 'slope': a, 'offset': b, 'base': 10, 'units': 'mbar'}
+                value = base ** (a*V + b), the response of most Pirani and Penning gauges
+
+Usage:
+    from calibration_class import make_calibration
+    calibration = make_calibration(settings['analogue_channels']['1'].get('calibration'))
+    pressure = calibration.apply(volts)  # float in, float out - list or array in, array out
+"""
+
+import numpy as np
+from logmanager import logger
+
+CALIBRATION_TYPES = ['polynomial', 'table', 'loglinear']
+
+
+class Calibration:  # pylint: disable=too-few-public-methods
+    """
+    Converts volts into engineering units using a polynomial, a piecewise linear lookup table or a log-linear
+    gauge response.
+    """
+    def __init__(self, config):
+        if not isinstance(config, dict) or config.get('type') not in CALIBRATION_TYPES:
+            raise ValueError('calibration type must be one of %s' % ', '.join(CALIBRATION_TYPES))
+        self.type = config['type']
+        self.units = config.get('units', '')
+        if self.type == 'polynomial':
+            # np.polyval expects the highest order coefficient first
+            self._coefficients = np.array(config['coefficients'], dtype=float)[::-1]
+            if self._coefficients.size == 0:
+                raise ValueError('polynomial calibration needs at least one coefficient')
+        elif self.type == 'table':
+            self._volts = np.array(config['volts'], dtype=float)
+            self._values = np.array(config['values'], dtype=float)
+            if self._volts.size < 2 or self._volts.size != self._values.size:
+                raise ValueError('table calibration needs two or more volts and the same number of values')
+            if np.any(np.diff(self._volts) <= 0):
+                raise ValueError('table calibration volts must be increasing')
+        else:
+            self._slope = float(config['slope'])
+            self._offset = float(config['offset'])
+            self._base = float(config.get('base', 10))
+
+    def apply(self, volts):
+        """
+        Converts a voltage or a sequence of voltages. A single value returns a float, anything else returns a
+        NumPy array.
+        """
+        array = np.asarray(volts, dtype=float)
+        if self.type == 'polynomial':
+            result = np.polyval(self._coefficients, array)
+        elif self.type == 'table':
+            result = np.interp(array, self._volts, self._values)
+        else:
+            result = np.power(self._base, self._slope * array + self._offset)
+        if result.ndim == 0:
+            return float(result)
+        return result
+
+
+def make_calibration(config, name=''):
+    """
+    Returns a Calibration for a channel calibration setting, or None if the channel has no calibration or the
+    setting is not valid (an error is logged).
+    """
+    if not config:
+        return None
+    try:
+        return Calibration(config)
+    except (KeyError, TypeError, ValueError) as exception:
+        logger.error('Calibration for %s not valid: %s', name, exception)
+        return None
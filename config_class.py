@@ -13,7 +13,7 @@ Key Features:
 
 Functions:
     friendlydirname(sourcename): Sanitizes strings by removing invalid characters
-    get_netifo(): Retrieves network configuration information
+    get_netifo(): Retrieves network configuration information, cached until the network changes
     validate_ipaddress(ip_str): Validates IPv4 address format
     validate_class(class_str): Validates network class (1-32)
     set_netinfo(mode, ip_addr, nwclass, df_gw, dns_server): Configures network interface
@@ -21,6 +21,7 @@ Functions:
 
 Dependencies:
     subprocess: For executing system commands
+    socket, fcntl: For reading the interface addresses and network change events from the kernel
     re: For regex pattern matching
     app_control: For settings management
     logmanager: For logging configuration changes
@@ -28,9 +29,25 @@ Dependencies:
 
 import subprocess
 import re
-from app_control import settings, writesettings, friendlyname
+import fcntl
+import errno
+import socket
+import struct
+from threading import Thread, Lock
+from time import monotonic
+from app_control import settings, settings_update, flushsettings, friendlyname
 from logmanager import logger
 
+NETWORK_INTERFACE = 'eth0'
+NETWORK_CONNECTION = 'Wired connection 1'
+SIOCGIFADDR = 0x8915  # ioctl reading the address of an interface
+SIOCGIFNETMASK = 0x891b  # ioctl reading the netmask of an interface
+RTMGRP_LINK = 0x1  # netlink groups of the link, IPv4 address and IPv4 route events
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+NETINFO_LOCK = Lock()
+NETINFO_CACHE = {'netinfo': {}, 'expires': 0.0, 'generation': 0, 'listening': False}
+
 
 def updatesetting(newsetting): # must be a dict object
     """
@@ -38,49 +55,140 @@ def updatesetting(newsetting): # must be a dict object
 
     This function takes a dictionary containing key-value pairs and updates the global `settings` object
     with the provided data. Each key from the input dictionary will replace or create a corresponding
-    key in the global `settings`. After updating, the function calls `writesettings()` to persist the changes.
+    key in the global `settings`. The changes are applied together with `settings_update()`, which publishes and
+    persists them.
 
     :param newsetting: A dictionary object containing key-value pairs to update the global settings.
     :type newsetting: dict
     """
     if isinstance(newsetting, dict):
-        for item in newsetting.keys():
-            settings[item] = newsetting[item]
+        with settings_update() as new_settings:
+            for item in newsetting.keys():
+                new_settings[item] = newsetting[item]
         logger.info('updatesetting: updated settings with %s', newsetting)
-        writesettings()
 
 
-def get_netifo():
+def read_interface_address(interface):
+    """
+    Reads the IPv4 address and prefix length of a network interface from the kernel, returns 'address/prefix' or
+    None if the interface has no IPv4 address.
+    """
+    request = struct.pack('256s', interface[:15].encode('utf-8'))
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            address = fcntl.ioctl(sock.fileno(), SIOCGIFADDR, request)[20:24]
+            netmask = fcntl.ioctl(sock.fileno(), SIOCGIFNETMASK, request)[20:24]
+        except OSError:
+            return None
+    return '%s/%d' % (socket.inet_ntoa(address), bin(struct.unpack('!L', netmask)[0]).count('1'))
+
+
+def read_default_gateway(interface):
+    """Reads the default gateway of a network interface from the kernel routing table, or '' if it has none."""
+    with open('/proc/net/route', 'r', encoding='utf-8') as routes:
+        for route in routes.readlines()[1:]:
+            fields = route.split()
+            if fields[0] == interface and fields[1] == '00000000' and int(fields[3], 16) & 2:
+                return socket.inet_ntoa(struct.pack('<L', int(fields[2], 16)))
+    return ''
+
+
+def read_dns_servers():
+    """Returns the name servers in /etc/resolv.conf."""
+    try:
+        with open('/etc/resolv.conf', 'r', encoding='utf-8') as resolv:
+            return [line.split()[1] for line in resolv if line.startswith('nameserver') and len(line.split()) > 1]
+    except OSError:
+        return []
+
+
+def read_netinfo():
     """
-    Retrieve network configuration information for "Wired connection 1".
+    Reads the network configuration of the wired interface. The addresses, gateway and name servers are read from
+    the kernel, only the DHCP or static method of the connection needs NetworkManager.
+    """
+    interface = NETWORK_INTERFACE
+    netinfo = {'ipv4.method': 'auto', 'IP4.ADDRESS[1]': '0.0.0.0/32', 'GENERAL.DEVICE': interface}
+    try:
+        method = subprocess.run(['/bin/nmcli', '-g', 'ipv4.method', 'con', 'show', NETWORK_CONNECTION],
+                                capture_output=True, timeout=5, check=True).stdout.decode(encoding='utf-8').strip()
+        if method:
+            netinfo['ipv4.method'] = method
+    except (OSError, subprocess.SubprocessError):
+        logger.warning('get_netifo: could not read the connection method from nmcli')
+    try:
+        with open('/sys/class/net/%s/address' % interface, 'r', encoding='utf-8') as hwaddr:
+            netinfo['GENERAL.HWADDR'] = hwaddr.read().strip().upper()
+        address = read_interface_address(interface)
+        if address:
+            netinfo['connection.interface-name'] = interface
+            netinfo['IP4.ADDRESS[1]'] = address
+        netinfo['IP4.GATEWAY'] = read_default_gateway(interface)
+    except OSError:
+        logger.warning('get_netifo: network interface %s not found', interface)
+    for index, server in enumerate(read_dns_servers(), 1):
+        netinfo['IP4.DNS[%d]' % index] = server
+    return netinfo
+
+
+def invalidate_netinfo():
+    """Discards the cached network configuration, it is read again by the next get_netifo."""
+    with NETINFO_LOCK:
+        NETINFO_CACHE['expires'] = 0.0
+        NETINFO_CACHE['generation'] += 1
 
-    This function uses the `nmcli` command-line tool to fetch detailed network
-    configuration information. The configuration details are returned in the form
-    of a dictionary where keys correspond to the configuration parameter names,
-    and values to their respective settings.
 
-    :raises subprocess.SubprocessError: If the subprocess to execute `nmcli` fails.
+def netlink_listener(netlink):
+    """Background loop invalidating the cached network configuration on every kernel link, address or route event."""
+    while True:
+        try:
+            netlink.recv(65536)
+        except OSError as error:
+            if error.errno != errno.ENOBUFS:  # ENOBUFS: events were dropped as they came faster than they were read
+                logger.exception('get_netifo: netlink listener stopped, the network cache now uses its TTL only')
+                return
+        invalidate_netinfo()
 
-    :return: A dictionary containing network configuration information for
-        "Wired connection 1". Keys are parameter names, and values are their
-        associated configuration settings. The dictionary always contains
-        at least the key `'ipv4.method'`, which defaults to `'unknown'` if
-        not provided in the output of `nmcli`.
+
+def start_netlink_listener():
+    """Subscribes to the kernel link, address and route change events, where netlink is available."""
+    try:
+        netlink = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        netlink.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE))
+    except (AttributeError, OSError):
+        logger.info('get_netifo: netlink not available, the network cache uses its TTL only')
+        return
+    listener_thread = Thread(target=netlink_listener, args=(netlink,), daemon=True)
+    listener_thread.name = 'Netlink listener'
+    listener_thread.start()
+
+
+def get_netifo():
+    """
+    Retrieve network configuration information for the wired connection.
+
+    The configuration is cached, the cache is discarded when the kernel reports a link, address or route change,
+    when set_netinfo changes the connection and after 'netinfo_cache_ttl' seconds, so the config page and the OLED
+    display do not start processes each time they are drawn.
+
+    :return: A dictionary containing network configuration information using the nmcli key names. The dictionary
+        always contains the keys `'ipv4.method'` and `'IP4.ADDRESS[1]'` (which is '0.0.0.0/32' when the
+        interface has no address).
     :rtype: dict
     """
-    netinfo = {'ipv4.method': 'auto', 'IP4.ADDRESS[1]': '0.0.0.0/32'}
-    nmcli = subprocess.Popen('/bin/nmcli -t dev show eth0', shell=True,
-                             stdout=subprocess.PIPE).stdout.read().decode(encoding='utf-8')
-    nmcli = nmcli.split('\n')
-    for row in nmcli[:-1]:
-        netinfo[row.split(':', maxsplit=1)[0]] = row.split(':', maxsplit=1)[1]
-
-    nmcli = subprocess.Popen('/bin/nmcli -t con show "Wired connection 1"', shell=True,
-                             stdout=subprocess.PIPE).stdout.read().decode(encoding='utf-8')
-    nmcli = nmcli.split('\n')
-    for row in nmcli[:-1]:
-        netinfo[row.split(':', maxsplit=1)[0]] = row.split(':', maxsplit=1)[1]
-    return netinfo
+    with NETINFO_LOCK:
+        if not NETINFO_CACHE['listening']:
+            NETINFO_CACHE['listening'] = True
+            start_netlink_listener()
+        if monotonic() < NETINFO_CACHE['expires']:
+            return dict(NETINFO_CACHE['netinfo'])
+        generation = NETINFO_CACHE['generation']
+    netinfo = read_netinfo()  # read without the lock, nmcli can take seconds
+    with NETINFO_LOCK:
+        if NETINFO_CACHE['generation'] == generation:  # not invalidated while it was being read
+            NETINFO_CACHE['netinfo'] = netinfo
+            NETINFO_CACHE['expires'] = monotonic() + settings['netinfo_cache_ttl']
+    return dict(netinfo)
 
 def validate_ipaddress(ip_str):
     """
@@ -155,6 +263,7 @@ def set_netinfo(mode, ip_addr, nwclass, df_gw, dns_server):
                          stdout=subprocess.PIPE).stdout.read().decode(encoding='utf-8')
         subprocess.Popen('/bin/sudo /bin/nmcli con up "Wired connection 1" ifname eth0', shell=True,
                          stdout=subprocess.PIPE).stdout.read().decode(encoding='utf-8')
+        invalidate_netinfo()
         logger.info('set_netinfo: Network set to DHCP')
         return {'mode': 'DHCP'}
     if not validate_ipaddress(ip_addr):
@@ -174,6 +283,7 @@ def set_netinfo(mode, ip_addr, nwclass, df_gw, dns_server):
                      stdout=subprocess.PIPE).stdout.read().decode(encoding='utf-8')
     subprocess.Popen('/bin/sudo /bin/nmcli con up "Wired connection 1" ifname eth0', shell=True,
                      stdout=subprocess.PIPE).stdout.read().decode(encoding='utf-8')
+    invalidate_netinfo()
     logger.info('set_netinfo: Network set to static with ip address %s/%s, default gateway %s, DNS server %s',
                    ip_addr, nwclass, df_gw, dns_server)
     return {'mode': 'static'}
@@ -189,8 +299,8 @@ def set_appname(name):
     :return: A dictionary containing the updated application name.
     """
     name = friendlyname(name)
-    settings['app-name'] = name
-    writesettings()
+    with settings_update() as new_settings:
+        new_settings['app-name'] = name
     logger.info('Appname changed to %s', name)
     hostname = name.upper()
     if len(hostname) > 15:
@@ -209,6 +319,7 @@ def restart_services():
     This function logs the action of restarting services, executes the system command to
     restart the `gunicorn` service, and logs the completion of the operation.
     """
+    flushsettings()
     logger.info('restarting services')
     subprocess.Popen( '/bin/sudo /bin/systemctl restart gunicorn.service', shell=True,
                      stdout=subprocess.PIPE).stdout.read().decode(encoding='utf-8')
@@ -220,46 +331,31 @@ def set_analogue_settings(newsettings):
     Updates the analogue settings by modifying specific configuration parameters. The function
     ensures that the analogue prefix is distinct from the digital prefix, updates channel names,
     enable/disable states based on the provided input, writes the changes to persistent storage,
-    logs the update information, and restarts relevant services to apply changes.
+    and logs the update information. The changes are applied to the running controller by reload_class.
 
     :param newsettings: A dictionary containing the new settings for the analogue configuration.
         It should include keys for channel names (e.g., 'ch1-name', 'ch2-name', etc.) and their
         enabled states (e.g., 'ch1-enabled', 'ch2-enabled', etc.), as well as an 'analogue_prefix'
-        key for the new analogue prefix.
+        key for the new analogue prefix. Channels with no name in the form are not changed.
     :type newsettings: dict
     :return: None
     """
-    if newsettings['analogue_prefix'] != settings['digital_prefix']:
-        settings['analogue_prefix'] = newsettings['analogue_prefix']
-    settings['analogue_channels']['1']['name'] = newsettings['ch1-name']
-    if 'ch1-enabled' in newsettings.keys() and settings['analogue_installed']:
-        settings['analogue_channels']['1']['enabled'] = True
-    else:
-        settings['analogue_channels']['1']['enabled'] = False
-    settings['analogue_channels']['2']['name'] = newsettings['ch2-name']
-    if 'ch2-enabled' in newsettings.keys() and settings['analogue_installed']:
-        settings['analogue_channels']['2']['enabled'] = True
-    else:
-        settings['analogue_channels']['2']['enabled'] = False
-    settings['analogue_channels']['3']['name'] = newsettings['ch3-name']
-    if 'ch3-enabled' in newsettings.keys() and settings['analogue_installed']:
-        settings['analogue_channels']['3']['enabled'] = True
-    else:
-        settings['analogue_channels']['3']['enabled'] = False
-    settings['analogue_channels']['4']['name'] = newsettings['ch4-name']
-    if 'ch4-enabled' in newsettings.keys() and settings['analogue_installed']:
-        settings['analogue_channels']['4']['enabled'] = True
-    else:
-        settings['analogue_channels']['4']['enabled'] = False
-    writesettings()
+    with settings_update() as new_settings:
+        if newsettings['analogue_prefix'] != new_settings['digital_prefix']:
+            new_settings['analogue_prefix'] = newsettings['analogue_prefix']
+        for channel_id, channel in new_settings['analogue_channels'].items():
+            name = newsettings.get('ch%s-name' % channel_id)
+            if name is None:  # channels added since the form was loaded are left unchanged
+                continue
+            channel['name'] = name
+            channel['enabled'] = 'ch%s-enabled' % channel_id in newsettings.keys() and settings['analogue_installed']
     logger.info('analogue settings updated')
-    restart_services()
 
 def set_digital_settings(newsettings):
     """
     Updates the digital settings configuration, including prefix, value, and command settings, as well as
-    individual channel configurations such as name, direction, exclusion, and enablement. After applying
-    the new settings, related services are restarted, and an informational log entry is created.
+    individual channel configurations such as name, direction, exclusion, and enablement, and creates an
+    informational log entry. The changed channels are rebuilt in the running controller by reload_class.
 
     :param newsettings: A dictionary containing the updated digital settings and individual channel
         configurations. Expected keys are:
@@ -276,22 +372,19 @@ def set_digital_settings(newsettings):
     :return: None
     """
     print(newsettings)
-    if newsettings['digital_prefix'] != settings['analogue_prefix']:
-        settings['digital_prefix'] = newsettings['digital_prefix']
-    settings['digital_on_value'] = newsettings['digital_on_value']
-    settings['digital_off_value'] = newsettings['digital_off_value']
-    settings['digital_on_command'] = newsettings['digital_on_command']
-    settings['digital_off_command'] = newsettings['digital_off_command']
-    for i in range(1, 17):
-        settings['digital_channels']['%d' %i]['name'] = newsettings['ch%d-name' %i]
-        settings['digital_channels']['%d' % i]['direction'] = newsettings['ch%d-direction' % i]
-        settings['digital_channels']['%d' % i]['excluded'] = newsettings['ch%d-excluded' %i]
-        if 'ch%d-enabled' %i in newsettings.keys():
-            settings['digital_channels']['%d' % i]['enabled'] = True
-        else:
-            settings['digital_channels']['%d' % i]['enabled'] = False
-        settings['digital_channels']['%d' % i]['pwm'] = newsettings['ch%d-pwm' %i]
-        settings['digital_channels']['%d' % i]['frequency'] = newsettings['ch%d-frequency' %i]
-    writesettings()
+    with settings_update() as new_settings:
+        if newsettings['digital_prefix'] != new_settings['analogue_prefix']:
+            new_settings['digital_prefix'] = newsettings['digital_prefix']
+        new_settings['digital_on_value'] = newsettings['digital_on_value']
+        new_settings['digital_off_value'] = newsettings['digital_off_value']
+        new_settings['digital_on_command'] = newsettings['digital_on_command']
+        new_settings['digital_off_command'] = newsettings['digital_off_command']
+        for i in range(1, 17):
+            channel = new_settings['digital_channels']['%d' % i]
+            channel['name'] = newsettings['ch%d-name' %i]
+            channel['direction'] = newsettings['ch%d-direction' % i]
+            channel['excluded'] = newsettings['ch%d-excluded' %i]
+            channel['enabled'] = 'ch%d-enabled' %i in newsettings.keys()
+            channel['pwm'] = newsettings['ch%d-pwm' %i]
+            channel['frequency'] = newsettings['ch%d-frequency' %i]
     logger.info('digital settings updated')
-    restart_services()
@@ -166,6 +166,16 @@ custom_settings = {
             'frequency': 500
         }
     },
+    'sequences': {
+        'ar-pipette': ['digital3 close', 'digital2 open', 'wait 15s', 'digital2 close', 'wait 0.5s', 'digital3 open',
+                       'wait 15s', 'digital3 close'],
+        'ne-pipette': ['digital5 close', 'digital4 open', 'wait 15s', 'digital4 close', 'wait 0.5s', 'digital5 open',
+                       'wait 15s', 'digital5 close'],
+        '4he-pipette': ['digital7 close', 'digital6 open', 'wait 15s', 'digital6 close', 'wait 0.5s', 'digital7 open',
+                        'wait 15s', 'digital7 close'],
+        '3he-pipette': ['digital9 close', 'digital8 open', 'wait 15s', 'digital8 close', 'wait 0.5s', 'digital9 open',
+                        'wait 15s', 'digital9 close']
+    },
     'serial_channels': [
         {
             "api-name": "ion-pump",
@@ -179,28 +189,40 @@ custom_settings = {
                   "name": "Ion Pressure",
                   "start": 9,
                   "string1": "fiAwMSAwQiAzMw0=",
-                  "string2": ""
+                  "string2": "",
+                  "terminator": "DQ==",
+                  "reply_length": 0,
+                  "inter_byte_timeout": 0
                   },
                  {"api-command": "start",
                   "length": -4,
                   "name": "start",
                   "start": 3,
                   "string1": "fiAwMSAzNyAyQg0=",
-                  "string2": ""
+                  "string2": "",
+                  "terminator": "DQ==",
+                  "reply_length": 0,
+                  "inter_byte_timeout": 0
                   },
                  {"api-command": "",
                   "length": -4,
                   "name": "Ion Status",
                   "start": 9,
                   "string1": "fiAwMSAwRCAzNQ0=",
-                  "string2": ""
+                  "string2": "",
+                  "terminator": "DQ==",
+                  "reply_length": 0,
+                  "inter_byte_timeout": 0
                   },
                  {"api-command": "stop",
                   "length": -4,
                   "name": "stop",
                   "start": 3,
                   "string1": "fiAwMSAzOCAyQw0=",
-                  "string2": ""
+                  "string2": "",
+                  "terminator": "DQ==",
+                  "reply_length": 0,
+                  "inter_byte_timeout": 0
                   }
                 ]
             },
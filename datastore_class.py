@@ -0,0 +1,258 @@
+"""
+Persistent time-series store for gauge, analogue and valve data.
+
+Readings are recorded in memory and written to an SQLite database in WAL mode in
+batches, one transaction every 'datastore_flush_interval' seconds, so the SD card
+sees one grouped write rather than an fsync per sample. The data is rolled up
+automatically from raw samples to 1 minute and 1 hour averages (with min and max)
+and each resolution is deleted once it is older than its retention period.
+
+Settings:
+    datastore_enabled (bool): Record data
+    datastore_path (str): Path of the SQLite database file
+    datastore_sample_interval (int): Seconds between calls to the registered samplers
+    datastore_flush_interval (int): Seconds between batched writes to the database
+    datastore_retention (dict): Days to keep each resolution: 'raw', '1m' and '1h'
+
+Usage:
+    from datastore_class import data_store
+    data_store.record('digital2', 1)
+    data_store.register_sampler(function)  # function is called every sample interval
+    data_store.query('ion-pump-ion-pressure', start, end, 'auto')
+    data_store.register_calibrated('analogue1', 'mbar')  # 'analogue1-calibrated' holds the calibrated values
+"""
+
+import os
+import sqlite3
+import atexit
+from threading import Thread, Lock
+from time import time, sleep
+from app_control import settings
+from logmanager import logger
+
+ROLLUPS = {'1m': 60, '1h': 3600}
+CALIBRATED_SUFFIX = '-calibrated'  # suffix of the series holding the calibrated values of a series
+MAX_PENDING = 100000  # samples held in memory if the database cannot be written
+
+
+class DataStore:
+    """
+    Batches recorded samples in memory and writes, rolls up and expires them on a background thread.
+    """
+    def __init__(self, path):
+        self._path = path
+        self._pending = []
+        self._lock = Lock()
+        self._samplers = []
+        self._calibrated = {}  # series: units of its calibrated series
+        self.enabled = settings['datastore_enabled']
+        if not self.enabled:
+            return
+        data_dir = os.path.dirname(self._path)
+        if data_dir and not os.path.exists(data_dir):
+            os.makedirs(data_dir)
+        connection = self.connect()
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS samples (series TEXT NOT NULL, ts REAL NOT NULL, value REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS samples_series_ts ON samples (series, ts);
+            CREATE TABLE IF NOT EXISTS samples_1m (series TEXT NOT NULL, ts REAL NOT NULL, value REAL NOT NULL,
+                                                   min REAL NOT NULL, max REAL NOT NULL, count INTEGER NOT NULL,
+                                                   PRIMARY KEY (series, ts));
+            CREATE TABLE IF NOT EXISTS samples_1h (series TEXT NOT NULL, ts REAL NOT NULL, value REAL NOT NULL,
+                                                   min REAL NOT NULL, max REAL NOT NULL, count INTEGER NOT NULL,
+                                                   PRIMARY KEY (series, ts));
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL NOT NULL);
+            """)
+        connection.close()
+        writer_thread = Thread(target=self.writer, daemon=True)
+        writer_thread.name = 'Data store writer'
+        writer_thread.start()
+        atexit.register(self.flush)
+        logger.info('Data Store: recording to %s', self._path)
+
+    def connect(self):
+        """
+        Opens a connection to the database in WAL mode. synchronous=NORMAL means a commit does not fsync,
+        the WAL is synced when it is checkpointed.
+        """
+        connection = sqlite3.connect(self._path, timeout=10)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def record(self, series, value, timestamp=None):
+        """
+        Queues a sample for the next batched write.
+        """
+        if not self.enabled or value is None:
+            return
+        with self._lock:
+            if len(self._pending) >= MAX_PENDING:
+                del self._pending[0]
+            self._pending.append((series, time() if timestamp is None else timestamp, float(value)))
+
+    def register_sampler(self, function):
+        """
+        Registers a function that is called every 'datastore_sample_interval' seconds to record values that are
+        not recorded as they change (e.g. analogue voltages).
+        """
+        self._samplers.append(function)
+
+    def register_calibrated(self, series, units=''):
+        """
+        Registers that the calibrated values of a series (e.g. analogue volts converted into pressure) are recorded
+        as the series name followed by CALIBRATED_SUFFIX, used when a query asks for calibrated values. The
+        calibrated values are stored and rolled up themselves because the calibration of a mean voltage is not the
+        mean of the calibrated values when the calibration is not linear.
+        """
+        self._calibrated[series] = units
+
+    def query_calibrated(self, series, start, end, resolution='auto'):
+        """
+        Returns the stored calibrated samples of a series in the same form as query, with their units.
+        """
+        if series not in self._calibrated:
+            return {'exception': 'no calibration registered for %s' % series}
+        result = self.query(series + CALIBRATED_SUFFIX, start, end, resolution)
+        if 'exception' not in result:
+            result.update(series=series, calibrated=True, units=self._calibrated[series])
+        return result
+
+    def writer(self):
+        """
+        Background loop, calls the samplers, writes the pending samples in one transaction and runs the rollups.
+        """
+        last_flush = time()
+        while True:
+            sleep(settings['datastore_sample_interval'])
+            for sampler in self._samplers:
+                try:
+                    sampler()
+                except Exception:  # pylint: disable=broad-exception-caught
+                    logger.exception('Data Store: sampler %s failed', sampler.__name__)
+            if time() - last_flush >= settings['datastore_flush_interval']:
+                last_flush = time()
+                self.flush()
+                self.rollup()
+
+    def flush(self):
+        """
+        Writes all pending samples to the database in a single transaction.
+        """
+        with self._lock:
+            batch = self._pending
+            self._pending = []
+        if not batch:
+            return
+        try:
+            connection = self.connect()
+            with connection:
+                connection.executemany('INSERT INTO samples (series, ts, value) VALUES (?, ?, ?)', batch)
+            connection.close()
+            logger.debug('Data Store: %d samples written', len(batch))
+        except sqlite3.Error:
+            logger.exception('Data Store: write failed, samples kept for the next flush')
+            with self._lock:
+                self._pending = (batch + self._pending)[-MAX_PENDING:]
+
+    def rollup(self):
+        """
+        Aggregates complete minutes of raw samples into samples_1m and complete hours of samples_1m into samples_1h,
+        then deletes data older than the retention period of each resolution. A period is only complete once all of
+        its samples have been written, so the rollups stop at the oldest sample still pending (e.g. after a failed
+        flush).
+        """
+        now = time()
+        with self._lock:
+            complete = min([sample[1] for sample in self._pending] + [now])
+        try:
+            connection = self.connect()
+            with connection:
+                self._rollup(connection, 'samples', 'samples_1m', ROLLUPS['1m'], complete)
+                self._rollup(connection, 'samples_1m', 'samples_1h', ROLLUPS['1h'], complete)
+                retention = settings['datastore_retention']
+                for table, days in (('samples', retention['raw']), ('samples_1m', retention['1m']),
+                                    ('samples_1h', retention['1h'])):
+                    connection.execute('DELETE FROM %s WHERE ts < ?' % table, (now - days * 86400,))
+            connection.close()
+        except sqlite3.Error:
+            logger.exception('Data Store: rollup failed')
+
+    @staticmethod
+    def _rollup(connection, source, target, period, complete):
+        """Aggregates the periods of source since the last rollup that end by the time complete into target."""
+        row = connection.execute('SELECT value FROM meta WHERE key = ?', (target,)).fetchone()
+        start = row[0] if row else 0.0
+        end = (complete // period) * period
+        if end <= start:
+            return
+        if source == 'samples':
+            aggregate = 'AVG(value), MIN(value), MAX(value), COUNT(*)'
+        else:
+            aggregate = 'SUM(value * count) / SUM(count), MIN(min), MAX(max), SUM(count)'
+        connection.execute('INSERT OR REPLACE INTO %s (series, ts, value, min, max, count) '
+                           'SELECT series, CAST(ts / %d AS INTEGER) * %d AS period, %s FROM %s '
+                           'WHERE ts >= ? AND ts < ? GROUP BY series, period'
+                           % (target, period, period, aggregate, source), (start, end))
+        connection.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (target, end))
+
+    def query(self, series, start, end, resolution='auto'):
+        """
+        Returns the stored samples of a series between start and end (epoch seconds). resolution is 'raw', '1m',
+        '1h' or 'auto' which picks raw for up to 2 hours, 1m for up to 7 days and 1h beyond that. Samples that
+        are still waiting to be written are included in raw results.
+        """
+        if resolution == 'auto':
+            span = end - start
+            resolution = 'raw' if span <= 7200 else '1m' if span <= 604800 else '1h'
+        if resolution not in ['raw', '1m', '1h']:
+            return {'exception': 'resolution must be raw, 1m, 1h or auto'}
+        connection = self.connect()
+        if resolution == 'raw':
+            rows = connection.execute('SELECT ts, value FROM samples WHERE series = ? AND ts BETWEEN ? AND ? '
+                                      'ORDER BY ts', (series, start, end)).fetchall()
+            with self._lock:
+                rows += [(sample[1], sample[2]) for sample in self._pending
+                         if sample[0] == series and start <= sample[1] <= end]
+            connection.close()
+            return {'series': series, 'resolution': resolution,
+                    'time': [row[0] for row in rows], 'value': [row[1] for row in rows]}
+        rows = connection.execute('SELECT ts, value, min, max FROM samples_%s WHERE series = ? AND ts BETWEEN ? AND ? '
+                                  'ORDER BY ts' % resolution, (series, start, end)).fetchall()
+        connection.close()
+        return {'series': series, 'resolution': resolution, 'time': [row[0] for row in rows],
+                'value': [row[1] for row in rows], 'min': [row[2] for row in rows], 'max': [row[3] for row in rows]}
+
+    def series(self):
+        """
+        Returns the names of the series held in the store.
+        """
+        connection = self.connect()
+        rows = connection.execute('SELECT DISTINCT series FROM samples UNION SELECT DISTINCT series FROM samples_1h '
+                                  'UNION SELECT DISTINCT series FROM samples_1m').fetchall()
+        connection.close()
+        with self._lock:
+            names = {row[0] for row in rows} | {sample[0] for sample in self._pending}
+        return sorted(names)
+
+
+def datastore_api(item, command):
+    """
+    Handles the 'datastore' api item, command is a dict with 'series', 'start', 'end' (epoch seconds) and
+    optionally 'resolution' and 'calibrated' (true to convert the values into engineering units). If no series
+    is given the list of stored series is returned.
+    """
+    if not data_store.enabled:
+        return {'item': item, 'command': command, 'values': '', 'exception': 'data store not enabled'}
+    if not isinstance(command, dict) or 'series' not in command:
+        return {'item': item, 'command': command, 'values': data_store.series()}
+    end = float(command.get('end', time()))
+    start = float(command.get('start', end - 3600))
+    if command.get('calibrated'):
+        result = data_store.query_calibrated(command['series'], start, end, command.get('resolution', 'auto'))
+    else:
+        result = data_store.query(command['series'], start, end, command.get('resolution', 'auto'))
+    return {'item': item, 'command': command, 'values': result}
+
+
+data_store = DataStore(settings['datastore_path'])
@@ -9,7 +9,13 @@ Key features:
 - ChannelObject class for configuring and interacting with individual GPIO channels
 - Support for reading digital input values from GPIO pins
 - Support for writing digital output values to GPIO pins
-- Helper functions for checking digital key format and converting values
+- Edge detection on input channels with an edge counter, last edge time and a ring of recent edges
+- Shadow state of output channels, updated on write and optionally verified against the pins
+  every 'digital_verify_interval' seconds, so status reads need no GPIO calls
+- Interlocks (see interlock_class) checked and applied under one lock with the pin change
+- Atomic writes of a group of channels, validated as a whole against the interlocks
+- Rebuilding only the channels whose settings have changed, without restarting the application
+- Helper functions for converting values
 - System-wide digital channel initialization and management
 
 The module integrates with the application's settings and logging systems to provide
@@ -21,13 +27,20 @@ Dependencies:
     app_control: For accessing application-wide settings
 """
 
+from collections import deque
+from threading import Thread
+from time import time, sleep
 from RPi import GPIO
 from logmanager import logger
-from app_control import settings, writesettings
+from app_control import settings, current_settings, settings_update
+from datastore_class import data_store
+from interlock_class import interlocks
 
 GPIO.setwarnings(False)
 GPIO.setmode(GPIO.BCM)
 
+EDGES = {'rising': GPIO.RISING, 'falling': GPIO.FALLING, 'both': GPIO.BOTH}
+
 
 class ChannelObject:
     """
@@ -54,6 +67,7 @@ class ChannelObject:
         self.name = channel_settings['name']
         self._running = 0  # used for PWM
         self.excluded = channel_settings['excluded']
+        self.config = dict(settings['digital_channels']['%d' % channel_id])  # the settings the channel was built with
         try:
             self.pwm = channel_settings['pwm']
         except KeyError:
@@ -62,13 +76,36 @@ class ChannelObject:
             self.frequency = channel_settings['frequency']
         except KeyError:
             self.change_setting('frequency', 100)
+        self.edge = channel_settings.get('edge', 'both')
+        self.debounce = int(channel_settings.get('debounce', 0))
+        self.edge_count = 0
+        self.last_edge = 0.0
+        self.edges = deque(maxlen=settings['digital_edge_history'])
+        self._level = None  # shadow level of an output, None to read the pin
+        self._info = None  # (value, prefix, on value, off value, dict) of the pre-rendered info() dict
+        self._edge_detect = False
         if self.direction == 'input':
             GPIO.setup(self.gpio, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+            if self.enabled and self.edge in EDGES:
+                self.start_edge_detect()
         elif self.direction == 'output pwm':
             GPIO.setup(self.gpio, GPIO.OUT)
-            self.gpio_pwm = GPIO.PWM(self.gpio, channel_settings['frequency'])
+            self.gpio_pwm = GPIO.PWM(self.gpio, self.frequency)
         else:
             GPIO.setup(self.gpio, GPIO.OUT)
+            self._level = GPIO.input(self.gpio)
+
+    def close(self):
+        """
+        Releases the pin before the channel is rebuilt with new settings, edge detection and a PWM output are
+        stopped. An output pin is left at its current level.
+        """
+        if self._edge_detect:
+            GPIO.remove_event_detect(self.gpio)
+            self._edge_detect = False
+        if self.direction == 'output pwm' and self._running:
+            self.gpio_pwm.stop()
+            self._running = False
 
     def write(self, value):
         """
@@ -91,46 +128,120 @@ class ChannelObject:
         if self.direction == 'input':
             logger.warning('Cannot set digital channel "%s" as it is an input channel', self.name)
             return GPIO.input(self.gpio), 'Cannot set digital channel %s as it is an input channel' % self.name
-        if value == settings['digital_on_command']:
-            if int(self.excluded) > 0:
-                if digital_channels[int(self.excluded)].read() == 1:
-                    logger.warning('Cannot set digital channel "%s" as it is excluded partner is %s',
-                                   self.name, digital_value(1))
-                    return (GPIO.input(self.gpio), 'Cannot set digital channel %s as it is excluded partner is %s'
-                            % (self.name, digital_value(1)))
-            if self.direction == 'output pwm':
-                self.gpio_pwm.ChangeFrequency(self.frequency)
-                self.gpio_pwm.start(self.pwm)
-                self._running = True
-            else:
-                GPIO.output(self.gpio, 1)
-        elif value == settings['digital_off_command']:
-            if self.direction == 'output pwm':
-                self.gpio_pwm.stop()
-                self._running = False
-            else:
-                GPIO.output(self.gpio, 0)
+        current = current_settings()
+        if value == current['digital_on_command']:
+            with interlocks.lock:
+                violation = interlocks.violation(self.digital_id)
+                if violation:
+                    logger.warning('Cannot set digital channel "%s" as interlock %s is %s',
+                                   self.name, violation, digital_value(1))
+                    return (self.read(), 'Cannot set digital channel %s as interlock %s is %s'
+                            % (self.name, violation, digital_value(1)))
+                self.set_pin(1)
+        elif value == current['digital_off_command']:
+            with interlocks.lock:
+                self.set_pin(0)
         else:
             logger.warning('Invalid value "%s" for digital channel "%s"', value, self.name)
             return 'Invalid value %s for digital channel %s' % (value, self.name)
         logger.info('Digital Channel "%s" set to "%s"', self.name, value)
+        data_store.record('%s%d' % (current['digital_prefix'], self.digital_id), self.read())
         return ''
 
+    def set_pin(self, level):
+        """
+        Sets the pin of an output channel (starts or stops the PWM output) and records the new state, the caller
+        must hold the interlock lock.
+        """
+        if self.direction == 'output pwm':
+            if level == 1:
+                self.gpio_pwm.ChangeFrequency(self.frequency)
+                self.gpio_pwm.start(self.pwm)
+            else:
+                self.gpio_pwm.stop()
+            self._running = level == 1
+        else:
+            GPIO.output(self.gpio, level)
+            self._level = level
+        interlocks.set_state(self.digital_id, level)
+
+    def start_edge_detect(self):
+        """
+        Starts edge detection on an input channel, edge_callback is called by the GPIO event thread on each
+        rising, falling or both edges (the 'edge' setting) with a debounce time of 'debounce' milliseconds.
+        """
+        try:
+            if self.debounce > 0:
+                GPIO.add_event_detect(self.gpio, EDGES[self.edge], callback=self.edge_callback,
+                                      bouncetime=self.debounce)
+            else:
+                GPIO.add_event_detect(self.gpio, EDGES[self.edge], callback=self.edge_callback)
+        except RuntimeError:
+            logger.exception('Digital channel "%s": edge detection failed, the input will be polled', self.name)
+            return
+        self._edge_detect = True
+        logger.info('Digital channel "%s": %s edge detection started', self.name, self.edge)
+
+    def edge_callback(self, _gpio):
+        """
+        Called on the GPIO event thread for each edge, this is the only thread that updates the edge data so no
+        lock is needed: the counter and time are single assignments and the deque append is atomic.
+        """
+        timestamp = time()
+        level = GPIO.input(self.gpio)
+        self.edge_count += 1
+        self.last_edge = timestamp
+        self.edges.append((timestamp, level))
+        data_store.record('%s%d' % (settings['digital_prefix'], self.digital_id), level, timestamp)
+
+    def events(self, command):
+        """
+        Returns the edge data of an input channel: the edge count, the time of the last edge and the recent edges
+        as [time, level] pairs, oldest first. The command 'reset' clears the count and the recent edges.
+        """
+        if command == 'reset':
+            self.edge_count = 0
+            self.edges.clear()
+            logger.info('Digital channel "%s" edge count reset', self.name)
+        return {'%s' % settings['digital_prefix']: self.digital_id, 'name': self.name, 'edge': self.edge,
+                'count': self.edge_count, 'last_edge': self.last_edge,
+                'edges': [list(edge) for edge in self.edges], 'value': digital_value(self.read())}
+
     def read(self):
         """
         Reads the current state of the GPIO pin.
 
         This method reads and returns the current logical state of the specified
         GPIO pin. It uses the GPIO library to retrieve the input value, which
-        indicates whether the pin is logically HIGH or LOW.
+        indicates whether the pin is logically HIGH or LOW. An output channel returns
+        its shadow state (the value last written). An input channel always reads the
+        pin, as the debounce time can drop the edge of a level change so the level of
+        the last edge is not always the level of the pin.
 
         :return: Logical state of the GPIO pin as returned by the GPIO library
         :rtype: int or bool
         """
         if self.direction == 'output pwm':
             return self._running
+        if self._level is not None:
+            return self._level
         return GPIO.input(self.gpio)
 
+    def verify(self):
+        """
+        Compares the shadow state of an output channel with the pin, if they differ the pin is logged and taken as
+        the state. The interlock lock is held so an API write cannot change the pin between the read and the update.
+        """
+        if self.direction != 'output' or self._level is None:
+            return
+        with interlocks.lock:
+            level = GPIO.input(self.gpio)
+            if level != self._level:
+                logger.warning('Digital channel "%s" shadow state %s does not match the pin %s', self.name,
+                               self._level, level)
+                self._level = level
+                interlocks.set_state(self.digital_id, level)
+
     def change_setting(self, setting, value):
         """
         Updates a specific setting for the current instance and persists the change.
@@ -138,17 +249,18 @@ class ChannelObject:
         This method modifies the attribute of the current instance with the provided
         `setting` and `value`. It also updates the corresponding setting in the global
         `settings` dictionary, ensuring that the digital channel's configuration is
-        consistently maintained. Finally, the settings are saved via the writesettings()
-        function, and a log entry is created indicating the updated settings.
+        consistently maintained. The settings are changed and saved with settings_update(),
+        and a log entry is created indicating the updated settings.
         """
         if setting in['pwm', 'frequency']:
             value = float(value)
         if setting in ['GPIO']:
             value = int(value)
         setattr(self, setting, value)
-        digital_prefix = '%d' % (self.digital_id)
-        settings['digital_channels'][digital_prefix][setting] = value
-        writesettings()
+        self._info = None
+        with settings_update() as new_settings:
+            new_settings['digital_channels']['%d' % self.digital_id][setting] = value
+        self.config[setting] = value
         logger.info('Digital channel %s setting %s updated', self.name, setting)
 
     def info(self):
@@ -159,39 +271,33 @@ class ChannelObject:
         The returned dictionary includes the identifier, name, direction, status of
         the object (enabled/disabled), and its current value. If the direction is set
         to 'output pwm', additional fields like pwm and frequency are also included.
+
+        The dictionary is rendered once and returned again until the state or the
+        settings it depends on change, so it must not be modified by the caller.
+        The cache key and dictionary are held in one tuple so a write on another
+        thread can never leave a stale value cached. An input that has to be polled
+        is rendered on every call.
         """
-        dataval= {'%s' % settings['digital_prefix']: self.digital_id,
+        value = self.read()
+        current = current_settings()
+        info = self._info
+        if (info is not None and info[0] == value and info[1] == current['digital_prefix']
+                and info[2] == current['digital_on_value'] and info[3] == current['digital_off_value']):
+            return info[4]
+        dataval= {'%s' % current['digital_prefix']: self.digital_id,
                   'name': self.name,
                   'direction': self.direction,
                   'enabled': self.enabled,
-                  'value': digital_value(self.read())}
+                  'value': digital_value(value)}
         if self.direction == 'output pwm':
             dataval['pwm'] = self.pwm
             dataval['frequency'] = self.frequency
+        if self.direction == 'output pwm' or self._level is not None:
+            self._info = (value, current['digital_prefix'], current['digital_on_value'],
+                          current['digital_off_value'], dataval)
         return dataval
 
 
-def check_digital_key(item):
-    """
-    Check if the given item matches a digital key based on a predefined prefix.
-
-    This function iterates through a range of identifiers and checks if the
-    provided item matches a specific format comprising a digital prefix and an
-    identifier value. If a match is found, it returns True. Otherwise, it
-    returns False.
-
-    :param item: The item to be checked against the digital key format.
-    :type item: str
-    :return: A boolean indicating whether the given item matches the expected digital key format.
-    :rtype: bool
-    """
-    for item_id in range(16, 0, -1):
-        digital_prefix = '%s%d' % (settings['digital_prefix'], item_id)
-        if item[:len(digital_prefix)] == digital_prefix:
-            return True
-    return False
-
-
 def digital_value(value):
     """
     Convert a digital input value to its corresponding system-defined digital representation.
@@ -207,9 +313,9 @@ def digital_value(value):
     :rtype: str
     """
     if value == 1:
-        return settings['digital_on_value']
+        return current_settings()['digital_on_value']
     if value == 0:
-        return settings['digital_off_value']
+        return current_settings()['digital_off_value']
     return 'error'
 
 
@@ -223,15 +329,22 @@ def digital_single_channel(item, command):
     read channel state in a predefined format.
     """
     error_message = ''
+    current = current_settings()
     if item[-4:] == '-pwm':
-        channel = int(item[len(settings['digital_prefix']):-4])
+        channel = int(item[len(current['digital_prefix']):-4])
         task = 'pwm'
     elif item[-10:] == '-frequency':
-        channel = int(item[len(settings['digital_prefix']):-10])
+        channel = int(item[len(current['digital_prefix']):-10])
         task = 'frequency'
+    elif item[-7:] == '-events':
+        channel = int(item[len(current['digital_prefix']):-7])
+        if digital_channels[channel].direction != 'input':
+            return {'item': item, 'command': command, 'exception': 'Digital channel %s is not an input channel' % item,
+                    'values': ''}
+        return {'item': item, 'command': command, 'values': digital_channels[channel].events(command)}
     else:
-        channel = int(item[len(settings['digital_prefix']):])
-        if command in [settings['digital_on_command'], settings['digital_off_command']]:
+        channel = int(item[len(current['digital_prefix']):])
+        if command in [current['digital_on_command'], current['digital_off_command']]:
             task= 'write'
         else:
             task = 'read'
@@ -244,10 +357,67 @@ def digital_single_channel(item, command):
         error_message = digital_channels[channel].write(command)
     if error_message != '':
         return {'item': item, 'command': command, 'exception': error_message, 'values':
-            {'%s%d' % (settings['digital_prefix'], channel): digital_channels[channel].info()}}
+            {'%s%d' % (current['digital_prefix'], channel): digital_channels[channel].info()}}
     return {'item': item, 'command': command, 'values': digital_channels[channel].info()}
 
 
+def digital_set(item, command):
+    """
+    Sets a group of output channels at once, command is a {channel: command} dict where channel is the channel
+    number or name (e.g. 2 or 'digital2') and command the digital on or off command. The whole set is checked
+    first: every channel must be an enabled output and the state after the change must not break an interlock.
+    The pins are then set in one critical section, channels being closed before those being opened, with one
+    log entry. If any check fails no channel is changed.
+    """
+    if not isinstance(command, dict) or not command:
+        return {'item': item, 'command': command, 'exception': 'command must be a {channel: command} dict',
+                'values': ''}
+    current = current_settings()
+    changes = []
+    for key, value in command.items():
+        key = str(key)
+        if key.startswith(current['digital_prefix']):
+            key = key[len(current['digital_prefix']):]
+        channel = digital_channels.get(int(key)) if key.isdigit() else None
+        if channel is None:
+            error = 'no digital channel %s' % key
+        elif channel in [change[0] for change in changes]:
+            error = 'digital channel %s is set more than once' % channel.name
+        elif not channel.enabled or channel.direction == 'input':
+            error = 'digital channel %s is not an enabled output' % channel.name
+        elif value not in [current['digital_on_command'], current['digital_off_command']]:
+            error = 'invalid value %s for digital channel %s' % (value, channel.name)
+        else:
+            changes.append((channel, 1 if value == current['digital_on_command'] else 0))
+            continue
+        logger.warning('Digital set refused: %s', error)
+        return {'item': item, 'command': command, 'exception': error, 'values': ''}
+    changes.sort(key=lambda change: change[1])
+    with interlocks.lock:
+        state = interlocks.state
+        for channel, level in changes:
+            if level == 1:
+                state |= 1 << channel.digital_id
+            else:
+                state &= ~(1 << channel.digital_id)
+        for channel, level in changes:
+            violation = interlocks.violation(channel.digital_id, state) if level == 1 else ''
+            if violation:
+                logger.warning('Digital set refused: channel %s, interlock %s', channel.name, violation)
+                return {'item': item, 'command': command, 'values': '',
+                        'exception': 'Cannot set digital channel %s as interlock %s would be %s'
+                                     % (channel.name, violation, digital_value(1))}
+        for channel, level in changes:
+            channel.set_pin(level)
+    logger.info('Digital set: %s', ', '.join('"%s" %s' % (channel.name, digital_value(level))
+                                             for channel, level in changes))
+    values = {}
+    for channel, level in changes:
+        data_store.record('%s%d' % (current['digital_prefix'], channel.digital_id), level)
+        values['%s%d' % (current['digital_prefix'], channel.digital_id)] = channel.info()
+    return {'item': item, 'command': command, 'values': values}
+
+
 def digital_all_values(item, command):
     """
     Generates a json representation of digital values for configured digital channels.
@@ -268,7 +438,53 @@ def digital_all_values(item, command):
     return {'item': item, 'command': command, 'values': returned_data}
 
 
+def read_input(channel_id):
+    """
+    Returns the level of the pin of an input channel, used by the interlocks to read input partners live rather
+    than from a shadow level that a missed edge could leave wrong.
+    """
+    return GPIO.input(digital_channels[channel_id].gpio)
+
+
+def reload_digital_channels():
+    """
+    Rebuilds the digital channels whose settings have changed and recompiles the interlocks, under the interlock
+    lock so no channel is written while it is being replaced. Returns the ids of the rebuilt channels.
+    """
+    rebuilt = []
+    with interlocks.lock:
+        for channel_id, channel in digital_channels.items():
+            channel_settings = settings['digital_channels'][str(channel_id)]
+            if channel_settings != channel.config:
+                channel.close()
+                digital_channels[channel_id] = ChannelObject(channel_settings, channel_id)
+                interlocks.set_state(channel_id, digital_channels[channel_id].read())
+                rebuilt.append(channel_id)
+        interlocks.compile(settings['interlocks'], settings['digital_channels'], read_input)
+    logger.info('Digital channels reloaded, rebuilt: %s', rebuilt)
+    return rebuilt
+
+
+def verify_outputs():
+    """
+    Background loop comparing the shadow state of the output channels with the pins every
+    'digital_verify_interval' seconds.
+    """
+    while True:
+        sleep(settings['digital_verify_interval'])
+        for channel in digital_channels.values():
+            if channel.enabled:
+                channel.verify()
+
+
 # setup digital channels
 digital_channels = {}
 for i in range(1, 17):
     digital_channels[i] = ChannelObject(settings['digital_channels'][str(i)], i)
+    if digital_channels[i].read() == 1:
+        interlocks.set_state(i, 1)
+interlocks.compile(settings['interlocks'], settings['digital_channels'], read_input)
+if settings['digital_verify_interval'] > 0:
+    verify_thread = Thread(target=verify_outputs, daemon=True)
+    verify_thread.name = 'Digital verify'
+    verify_thread.start()
@@ -0,0 +1,135 @@
+"""
+In-memory history of readings held in fixed capacity ring buffers.
+
+Each RingBuffer keeps the most recent readings of one value as two compact arrays of
+timestamps and float values, so memory use is fixed at 16 bytes per sample no matter how
+long the controller runs. A time window is returned as a single slice of each array.
+
+The samples are ordered by the monotonic clock, as the Pi has no real time clock and its
+wall clock can be stepped back by NTP after boot. Wall times are worked out when the
+history is read, from the current difference between the wall and monotonic clocks.
+
+Classes:
+    RingBuffer: Fixed capacity history of (timestamp, value) samples
+
+Functions:
+    reading_value: Extracts the numeric part of a reading string
+    history_window: Converts an API command into a start and end time
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from threading import Lock
+from time import time, monotonic
+
+
+def reading_value(value):
+    """
+    Returns the numeric value of a reading such as '1.2E-08 Torr' as a float. The whole string is tried
+    first, then each space separated part. Returns None if the reading contains no number.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    for part in str(value).split():
+        try:
+            return float(part)
+        except ValueError:
+            continue
+    return None
+
+
+def history_window(command):
+    """
+    Converts the command of a history API call into a (start, end) pair of epoch times. The command can be a
+    number of seconds back from now (a number or a numeric string), a dict with 'start' and/or 'end' epoch times,
+    or False, None, '' or 'all' for the whole history. Raises ValueError for any other command.
+    """
+    if isinstance(command, dict):
+        return float(command.get('start', 0)), float(command.get('end', time()))
+    if command in (False, None, '', 'all'):
+        return 0.0, time()
+    if isinstance(command, bool):
+        raise ValueError('history window must be a number of seconds, a start and end or all')
+    try:
+        seconds = float(command)
+    except TypeError:
+        raise ValueError('history window must be a number of seconds, a start and end or all') from None
+    if seconds <= 0:
+        raise ValueError('history window must be a positive number of seconds')
+    return time() - seconds, time()
+
+
+def clock_offset():
+    """Returns the wall clock time less the monotonic clock time."""
+    return time() - monotonic()
+
+
+class RingBuffer:
+    """
+    A fixed capacity history of (timestamp, value) samples. Once full the oldest sample is overwritten by
+    each new one. The samples are held in monotonic clock order, a sample is never given an earlier time than
+    the one before it, which allows a time window to be found with a binary search of each of the two ordered
+    segments of the ring.
+    """
+    def __init__(self, capacity):
+        self._capacity = max(int(capacity), 1)
+        self._times = array('d', bytes(8 * self._capacity))
+        self._values = array('d', bytes(8 * self._capacity))
+        self._head = 0  # next position to write
+        self._count = 0
+        self._lock = Lock()
+
+    def append(self, value, timestamp=None):
+        """
+        Adds a sample to the history, timestamp (wall clock) defaults to now.
+        """
+        stamp = monotonic() if timestamp is None else timestamp - clock_offset()
+        with self._lock:
+            if self._count:
+                stamp = max(stamp, self._times[(self._head - 1) % self._capacity])
+            self._times[self._head] = stamp
+            self._values[self._head] = value
+            self._head = (self._head + 1) % self._capacity
+            if self._count < self._capacity:
+                self._count += 1
+
+    def _segments(self):
+        """The ring as (start, end) index ranges of the arrays, oldest first."""
+        if self._count < self._capacity:
+            return [(0, self._count)]
+        return [(self._head, self._capacity), (0, self._head)]
+
+    def window(self, start=0.0, end=None):
+        """
+        Returns the samples with start <= timestamp <= end (wall clock) as two arrays of wall clock times and
+        values, oldest first.
+        """
+        offset = clock_offset()
+        start = start - offset
+        end = monotonic() if end is None else end - offset
+        times = array('d')
+        values = array('d')
+        with self._lock:
+            for seg_start, seg_end in self._segments():
+                low = bisect_left(self._times, start, seg_start, seg_end)
+                high = bisect_right(self._times, end, low, seg_end)
+                times += self._times[low:high]
+                values += self._values[low:high]
+        return array('d', (stamp + offset for stamp in times)), values
+
+    def latest(self):
+        """
+        Returns the most recent (timestamp, value) sample or None if the history is empty.
+        """
+        with self._lock:
+            if self._count == 0:
+                return None
+            last = (self._head - 1) % self._capacity
+            return self._times[last] + clock_offset(), self._values[last]
+
+    def __len__(self):
+        return self._count
@@ -0,0 +1,131 @@
+"""
+Interlocks between the digital channels, compiled into bitmask rules.
+
+Each rule stops a channel being opened while all of a set of other channels are open, for
+example "never open the Ar input while the heating cell and the Ne output are open":
+    settings['interlocks'] = [{'name': 'Ar input', 'channel': 2, 'when_open': [1, 5]}]
+The single 'excluded' partner of each digital channel is compiled into a rule as well.
+
+The open channels are held as one integer with bit n set while channel n is open, kept up to
+date by the digital channels as they are written. Input channels are not written, so their bits
+are read live from the channels (with the reader given to compile) each time a rule is checked.
+A rule is a mask of its channels, so checking a channel is one AND per rule against the state.
+The state is only read and changed while the interlock lock is held, and a channel checks its
+rules and sets its pin under that lock, so two threads opening partner valves at the same moment
+cannot both pass their check.
+
+Usage:
+    from interlock_class import interlocks
+    with interlocks.lock:
+        violation = interlocks.violation(channel_id)
+        if not violation:
+            ...set the pin...
+            interlocks.set_state(channel_id, 1)
+"""
+
+from threading import RLock
+from logmanager import logger
+
+
+class Interlocks:
+    """
+    The interlock rules of the digital channels and the open/closed state they are checked against.
+    """
+    def __init__(self):
+        self.lock = RLock()
+        self._state = 0
+        self._rules = {}  # channel id: list of (mask, rule name)
+        self._inputs = 0  # mask of the input channels, read live when a rule is checked
+        self._read_input = None  # function returning the level of an input channel
+
+    def compile(self, rules, digital_channels, read_input=None):
+        """
+        Compiles the 'interlocks' setting and the 'excluded' partner of each digital channel setting into bitmask
+        rules, rules that are not valid are logged and ignored. read_input(channel_id) returns the level of an
+        input channel, without it the inputs are taken from the recorded state.
+        """
+        compiled = {}
+        inputs = 0
+        if read_input is not None:
+            for channel_id, channel in digital_channels.items():
+                if channel.get('direction') == 'input':
+                    inputs |= 1 << int(channel_id)
+        for channel_id, channel in digital_channels.items():
+            partner = int(channel.get('excluded', 0) or 0)
+            if partner > 0 and str(partner) in digital_channels:
+                compiled.setdefault(int(channel_id), []).append(
+                    (1 << partner, 'excluded partner "%s"' % digital_channels[str(partner)]['name']))
+        for index, rule in enumerate(rules, 1):
+            try:
+                channel_id = int(rule['channel'])
+                mask = 0
+                for other in rule['when_open']:
+                    if str(other) not in digital_channels or int(other) == channel_id:
+                        raise ValueError('channel %s' % other)
+                    mask |= 1 << int(other)
+                if mask == 0 or str(channel_id) not in digital_channels:
+                    raise ValueError('channel %s' % channel_id)
+            except (KeyError, TypeError, ValueError) as exception:
+                logger.error('Interlock %s not valid: %s', rule, exception)
+                continue
+            compiled.setdefault(channel_id, []).append((mask, rule.get('name', 'interlock %d' % index)))
+        with self.lock:
+            self._rules = compiled
+            self._inputs = inputs
+            self._read_input = read_input
+        logger.info('Interlocks: %d rules compiled', sum(len(channel_rules) for channel_rules in compiled.values()))
+
+    def set_state(self, channel_id, level):
+        """Records a channel as open (level 1) or closed (level 0)."""
+        with self.lock:
+            if level == 1:
+                self._state |= 1 << channel_id
+            else:
+                self._state &= ~(1 << channel_id)
+
+    def live_state(self, state=None):
+        """Returns the state (default the current state) with the bits of the input channels read live."""
+        if state is None:
+            state = self._state
+        inputs, read_input = self._inputs, self._read_input
+        for channel_id in range(inputs.bit_length()):
+            if inputs & (1 << channel_id):
+                if read_input(channel_id) == 1:
+                    state |= 1 << channel_id
+                else:
+                    state &= ~(1 << channel_id)
+        return state
+
+    def violation(self, channel_id, state=None):
+        """
+        Returns the name of the first rule that stops the channel being opened, or '' if it may be opened. The
+        state defaults to the current state, the caller must hold the lock for the result to stay true. The input
+        channels of the rules are read live.
+        """
+        rules = self._rules.get(channel_id, ())
+        if not rules:
+            return ''
+        state = self.live_state(state)
+        for mask, name in rules:
+            if state & mask == mask:
+                return name
+        return ''
+
+    @property
+    def state(self):
+        """The open channels as a bitmask, bit n is channel n."""
+        return self._state
+
+    def info(self, item, command):
+        """Handles the 'interlocks' api item, returns the compiled rules and the open channels."""
+        rules = []
+        for channel_id, channel_rules in sorted(self._rules.items()):
+            for mask, name in channel_rules:
+                rules.append({'name': name, 'channel': channel_id,
+                              'when_open': [bit for bit in range(mask.bit_length()) if mask & (1 << bit)]})
+        state = self.live_state()
+        return {'item': item, 'command': command, 'values': {
+            'rules': rules, 'open': [bit for bit in range(state.bit_length()) if state & (1 << bit)]}}
+
+
+interlocks = Interlocks()
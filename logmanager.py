@@ -29,11 +29,37 @@ Log Files:
     Logs are stored with automatic rotation to prevent excessive disk usage
     while maintaining historical records.
 
+Log Reading:
+    read_log_page(file_path, before, limit) returns the newest lines of a log, newest
+    first, reading backwards from the end of the file in blocks and continuing into the
+    rotated backups (.1 ... .10). It also returns a cursor for the next (older) page.
+
+Log Search:
+    search_log(file_path, text, level, start, end, limit) searches a log and its rotated
+    backups for lines with every word of text, a log level and a time range, using a
+    LogIndex. Each file is split into blocks of lines and the index holds the first and
+    last timestamp of each block (a sparse timestamp to offset index) and a bitmask of the
+    blocks containing each word and level. Only blocks that can match are read. The index
+    is extended as the log grows and is kept by inode, so a file keeps its index when it is
+    renamed by a rotation. At most LOG_INDEX_MAX_TOKENS words are indexed for each file,
+    the blocks after that are read by every search.
+
+System Journal:
+    read_journal(cursor, limit) returns a page of the system journal, newest first, by
+    running journalctl without a shell. Results are cached for 'journal_cache_ttl' seconds
+    and identical requests made at the same time share a single journalctl run.
+
 Author: Gary Twinn
 """
 import os
+import re
 import sys
+import time
 import logging
+import subprocess
+from concurrent.futures import Future
+from datetime import datetime
+from threading import Lock
 from logging.handlers import RotatingFileHandler
 from app_control import settings
 
@@ -50,14 +76,337 @@ Usage:\n
 **logger.error('message')** for errors
 """
 
-if settings['loglevel'].upper() == 'DEBUG':
-    logger.setLevel(logging.DEBUG)
-else:
-    logger.setLevel(logging.INFO)
 
-LogFile = RotatingFileHandler(settings['logfilepath'], maxBytes=1048576, backupCount=10)
+def set_log_level(level):
+    """Sets the level of the application logger, 'DEBUG' or otherwise 'INFO', takes effect immediately"""
+    if level.upper() == 'DEBUG':
+        logger.setLevel(logging.DEBUG)
+    else:
+        logger.setLevel(logging.INFO)
+
+
+set_log_level(settings['loglevel'])
+
+LOG_BACKUP_COUNT = 10
+LOG_READ_BLOCK = 65536
+LOG_INDEX_BLOCK = 16384  # bytes of log lines per search index block
+LOG_INDEX_MAX_TOKENS = 50000  # words indexed for each file, later blocks are not indexed by word
+LOG_TOKEN = re.compile(r'[a-z0-9]+')
+LOG_LEVEL = re.compile(r'\[(DEBUG|INFO|WARNING|ERROR|CRITICAL)\]')
+JOURNALCTL = '/bin/journalctl'
+JOURNAL_TIMEOUT = 30
+LOG_TIMESTAMPS = ((re.compile(r'\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})[,\]]'), '%Y-%m-%d %H:%M:%S'),  # application log
+                  (re.compile(r'\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} [+-]\d{4})\]'), '%Y-%m-%d %H:%M:%S %z'),  # gunicorn error
+                  (re.compile(r'\[(\d{2}/\w{3}/\d{4}:\d{2}:\d{2}:\d{2} [+-]\d{4})\]'), '%d/%b/%Y:%H:%M:%S %z'))  # gunicorn access
+
+LogFile = RotatingFileHandler(settings['logfilepath'], maxBytes=1048576, backupCount=LOG_BACKUP_COUNT)
 formatter = logging.Formatter('[%(asctime)s] - [%(levelname)s] - %(message)s')
 LogFile.setFormatter(formatter)
 logger.addHandler(LogFile)
 logger.info('Runnng Python %s on %s', sys.version, sys.platform)
 logger.info('Logging level set to: %s', settings['loglevel'].upper())
+
+
+def log_files(file_path):
+    """
+    Returns a list of (path, inode, size) for a log file and its rotated backups that exist, newest first.
+    """
+    files = []
+    for backup in range(LOG_BACKUP_COUNT + 1):
+        path = file_path if backup == 0 else '%s.%d' % (file_path, backup)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        files.append((path, stat.st_ino, stat.st_size))
+    return files
+
+
+def read_lines_backwards(file_path, end, count):
+    """
+    Reads up to count complete lines that end at or before byte offset end, newest first, by seeking backwards
+    through the file in blocks. Returns the lines and the byte offset of the start of the oldest line returned.
+    """
+    position = end
+    data = b''
+    with open(file_path, 'rb') as log_file:
+        while position > 0 and data.count(b'\n') <= count:
+            block = min(LOG_READ_BLOCK, position)
+            position -= block
+            log_file.seek(position)
+            data = log_file.read(block) + data
+    lines = []
+    index = len(data)
+    while len(lines) < count and index > 0:
+        start = data.rfind(b'\n', 0, index - 1) + 1
+        if start == 0 and position > 0:
+            break  # the line starts before the data read
+        lines.append(data[start:index].decode('utf-8', errors='replace').rstrip('\r\n'))
+        index = start
+    return lines, position + index
+
+
+def read_log_page(file_path, before='', limit=500):
+    """
+    Returns (lines, cursor) where lines are up to limit lines of the log, newest first, and cursor is passed as
+    before to read the next older page ('' when there are no older lines). The cursor holds the inode of the file
+    and a byte offset so it still points at the same place after the log has been rotated.
+    """
+    files = log_files(file_path)
+    file_index = 0
+    offset = files[0][2] if files else 0
+    if before:
+        try:
+            inode, offset = (int(value) for value in before.split('-'))
+            file_index = [log_file[1] for log_file in files].index(inode)
+        except ValueError:
+            logger.warning('read_log_page: invalid cursor %s for %s', before, file_path)
+            return [], ''
+    lines = []
+    while file_index < len(files) and len(lines) < limit:
+        if offset > 0:
+            new_lines, offset = read_lines_backwards(files[file_index][0], offset, limit - len(lines))
+            lines += new_lines
+        if offset == 0:
+            file_index += 1
+            if file_index < len(files):
+                offset = files[file_index][2]
+    if file_index < len(files):
+        return lines, '%d-%d' % (files[file_index][1], offset)
+    return lines, ''
+
+
+def log_timestamp(line):
+    """
+    Returns the timestamp of a log line as epoch seconds, or None if the line has no timestamp. Application log
+    times are local time, gunicorn log times include their UTC offset.
+    """
+    for pattern, time_format in LOG_TIMESTAMPS:
+        found = pattern.search(line)
+        if found:
+            try:
+                if '%z' in time_format:
+                    return datetime.strptime(found.group(1), time_format).timestamp()
+                return time.mktime(time.strptime(found.group(1), time_format))
+            except ValueError:
+                return None
+    return None
+
+
+class LogIndex:
+    """
+    Search index for a log file and its rotated backups. For each file (keyed by inode) it holds a list of blocks
+    (start offset, end offset, first timestamp, last timestamp) and for every word and log level a bitmask of the
+    blocks that contain it. Once a file has LOG_INDEX_MAX_TOKENS words its later blocks are not indexed by word
+    ('unindexed' is the first of them), so the size of the index is limited however much is logged.
+    """
+    def __init__(self, file_path):
+        self._file_path = file_path
+        self._files = {}
+        self._lock = Lock()
+
+    def refresh(self):
+        """
+        Brings the index up to date with the files on disk: new files are indexed, grown files have their new lines
+        indexed and files that no longer exist are dropped. Returns the files newest first.
+        """
+        files = log_files(self._file_path)
+        current = {}
+        for path, inode, size in files:
+            index = self._files.get(inode)
+            if index is None or size < index['size']:
+                index = {'size': 0, 'blocks': [], 'tokens': {}, 'levels': {}, 'unindexed': None}
+            if size > index['size']:
+                self._index_file(path, index)
+            current[inode] = index
+        self._files = current
+        return files
+
+    @staticmethod
+    def _index_file(path, index):
+        """Indexes the complete lines of a file after the part already indexed."""
+        with open(path, 'rb') as log_file:
+            log_file.seek(index['size'])
+            data = log_file.read()
+        complete = data.rfind(b'\n') + 1
+        position = 0
+        while position < complete:
+            block_end = data.find(b'\n', min(position + LOG_INDEX_BLOCK, complete) - 1) + 1
+            LogIndex._index_block(index, data[position:block_end].decode('utf-8', errors='replace'),
+                                  index['size'] + position, index['size'] + block_end)
+            position = block_end
+        index['size'] += complete
+
+    @staticmethod
+    def _index_block(index, text, block_start, block_end):
+        """Adds a block of lines, the text between the byte offsets block_start and block_end of the file."""
+        lines = text.splitlines()
+        block_id = len(index['blocks'])
+        first_time = next((stamp for stamp in map(log_timestamp, lines) if stamp is not None), None)
+        last_time = next((stamp for stamp in map(log_timestamp, reversed(lines)) if stamp is not None), None)
+        index['blocks'].append((block_start, block_end, first_time, last_time))
+        bit = 1 << block_id
+        tokens = set(LOG_TOKEN.findall(text.lower()))
+        if index['unindexed'] is None and len(index['tokens']) + len(tokens) > LOG_INDEX_MAX_TOKENS:
+            index['unindexed'] = block_id
+        if index['unindexed'] is None:
+            for token in tokens:
+                index['tokens'][token] = index['tokens'].get(token, 0) | bit
+        for level in set(LOG_LEVEL.findall(text)):
+            index['levels'][level] = index['levels'].get(level, 0) | bit
+
+    def search(self, text='', level='', start=None, end=None, limit=500):
+        """
+        Returns up to limit lines, newest first, that contain every word of text (case insensitive), have the log
+        level and a timestamp between start and end (epoch seconds). Any of the conditions may be left empty.
+        """
+        conditions = (set(LOG_TOKEN.findall(text.lower())), level, start, end)
+        results = []
+        with self._lock:
+            for path, inode, _ in self.refresh():
+                index = self._files[inode]
+                candidates = self._candidates(index, conditions[0], level)
+                if not candidates:
+                    continue
+                for line in self._matching_lines(path, index['blocks'], candidates, conditions):
+                    results.append(line)
+                    if len(results) >= limit:
+                        return results
+        return results
+
+    @staticmethod
+    def _candidates(index, words, level):
+        """Returns the bitmask of the blocks of a file that may hold lines with all of the words and the level."""
+        candidates = (1 << len(index['blocks'])) - 1
+        unindexed = 0 if index['unindexed'] is None else candidates >> index['unindexed'] << index['unindexed']
+        for token in words:
+            candidates &= index['tokens'].get(token, 0) | unindexed
+        if level:
+            candidates &= index['levels'].get(level.upper(), 0)
+        return candidates
+
+    @staticmethod
+    def _matching_lines(path, blocks, candidates, conditions):
+        """
+        Yields the lines of the candidate blocks of a file that match the search conditions (words, level, start,
+        end), newest first. Blocks with no lines between start and end are not read.
+        """
+        start, end = conditions[2:]
+        with open(path, 'rb') as log_file:
+            for block_id in range(len(blocks) - 1, -1, -1):
+                block_start, block_end, first_time, last_time = blocks[block_id]
+                if not candidates >> block_id & 1:
+                    continue
+                if start is not None and last_time is not None and last_time < start:
+                    continue
+                if end is not None and first_time is not None and first_time > end:
+                    continue
+                log_file.seek(block_start)
+                lines = log_file.read(block_end - block_start).decode('utf-8', errors='replace').splitlines()
+                for line in reversed(lines):
+                    if match_log_line(line, *conditions):
+                        yield line
+
+
+def match_log_line(line, words, level, start, end):
+    """Checks a single log line against the search conditions, words is the set of words that must be present."""
+    if words and not words.issubset(LOG_TOKEN.findall(line.lower())):
+        return False
+    if level and '[%s]' % level.upper() not in line:
+        return False
+    if start is not None or end is not None:
+        stamp = log_timestamp(line)
+        if stamp is None:
+            return False
+        if (start is not None and stamp < start) or (end is not None and stamp > end):
+            return False
+    return True
+
+
+log_indexes = {}
+
+
+def search_log(file_path, text='', level='', start=None, end=None, limit=500):
+    """
+    Searches a log file and its rotated backups, see LogIndex.search. The index for each log is built on the first
+    search and updated on every search after that.
+    """
+    if file_path not in log_indexes:
+        log_indexes[file_path] = LogIndex(file_path)
+    return log_indexes[file_path].search(text, level, start, end, limit)
+
+
+class JournalReader:
+    """
+    Reads pages of the system journal with journalctl --reverse, caching each page for a short time and sharing
+    a single journalctl run between identical requests made at the same time.
+    """
+    def __init__(self):
+        self._cache = {}
+        self._running = {}
+        self._lock = Lock()
+
+    def read(self, cursor='', limit=500):
+        """
+        Returns (lines, next_cursor) for up to limit journal entries older than cursor, newest first. With no cursor
+        the newest entries are returned.
+        """
+        key = (cursor, limit)
+        with self._lock:
+            self.expire()
+            if key in self._cache:
+                return self._cache[key][1]
+            future = self._running.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._running[key] = future
+        if not owner:
+            return future.result()
+        try:
+            result = self._journalctl(cursor, limit)
+            with self._lock:
+                self._cache[key] = (time.monotonic(), result)
+            future.set_result(result)
+            return result
+        except Exception as error:
+            future.set_exception(error)
+            raise
+        finally:
+            with self._lock:
+                del self._running[key]
+
+    def expire(self):
+        """Drops the cached pages older than 'journal_cache_ttl' seconds, the caller must hold the lock."""
+        now = time.monotonic()
+        for key in [key for key, cached in self._cache.items() if now - cached[0] > settings['journal_cache_ttl']]:
+            del self._cache[key]
+
+    @staticmethod
+    def _journalctl(cursor, limit):
+        """Runs journalctl (without a shell) and splits the output into lines and the cursor of the last entry."""
+        command = [JOURNALCTL, '--reverse', '--no-pager', '--show-cursor', '-n', str(limit)]
+        if cursor:
+            command.append('--after-cursor=%s' % cursor)
+        try:
+            output = subprocess.run(command, capture_output=True, check=False, timeout=JOURNAL_TIMEOUT).stdout
+        except (OSError, subprocess.TimeoutExpired):
+            logger.exception('read_journal: journalctl failed')
+            return [], ''
+        lines = output.decode('utf-8', errors='replace').splitlines()
+        next_cursor = ''
+        if lines and lines[-1].startswith('-- cursor: '):
+            next_cursor = lines.pop()[len('-- cursor: '):]
+        if len(lines) < limit:
+            next_cursor = ''
+        return lines, next_cursor
+
+
+journal_reader = JournalReader()
+
+
+def read_journal(cursor='', limit=500):
+    """
+    Returns (lines, next_cursor) for a page of the system journal, newest first, see JournalReader.read.
+    """
+    return journal_reader.read(cursor, limit)
@@ -3,7 +3,14 @@ OLED Display Module for Raspberry Pi
 
 This module provides functionality to display system information on an OLED display
 connected to a Raspberry Pi via I2C. It shows the application name, version number,
-and network interface information (IP addresses and subnet masks).
+network interface information (IP address) and live values: the open valves and the
+serial readings named in settings['oled_values'], e.g. ['Turbo Pressure'].
+
+The display is opened once and kept by a background refresh thread, which redraws the
+text every 'oled_refresh_interval' seconds or when set_oled() is called. The display is
+only written when the text has changed, and then only the 8 pixel high pages of the
+SSD1306 framebuffer that differ from what is already on the display are sent, so web
+requests never wait for the I2C bus.
 
 Dependencies:
 - Adafruit SSD1306 library
@@ -17,61 +24,205 @@ Hardware:
 - Uses I2C interface with address 0x3C
 
 Usage:
-    from oledclass import set_oled
+    from oled_class import set_oled
     set_oled()  # Updates the OLED display with current system information
 """
 
+from threading import Thread, Event, Lock
+from time import monotonic
 from config_class import get_netifo
 from app_control import settings, VERSION
 from logmanager import logger
-if settings['oled_enabled']:
-    import board
-    from PIL import Image, ImageDraw, ImageFont
-    import adafruit_ssd1306
+from digital_class import digital_channels
+from serial_class import serial_channels
 
-def set_oled():
+SET_COL_ADDR = 0x21  # SSD1306 commands setting the column and page range of the next data write
+SET_PAGE_ADDR = 0x22
+COLUMN_OFFSETS = {64: 32, 72: 28}  # first column of the narrow panels, as used by adafruit_ssd1306 show()
+OPEN_RETRY_MAX = 60  # longest time in seconds between attempts to open a display that was not found
+
+
+def oled_text():
     """
-    Sets up and initializes an OLED display and configures it to show text
-    output, such as the application name, its version, and IP address information.
+    Returns the text shown on the display: the application name, version and IP address followed by the open
+    valves and the serial readings named in settings['oled_values'].
     """
-    if settings['oled_enabled']:  # skip if oled is not enabled
+    if len(settings['app-name']) > 16:
+        text = settings['app-name'][:15] + '...'
+    else:
+        text = settings['app-name']
+    text = text + '\nVER: ' + VERSION
+    netif = get_netifo()
+    try:
+        text = text + '\n%s: %s' % (netif['connection.interface-name'],
+                                    netif['IP4.ADDRESS[1]'].split('/', maxsplit=1)[0])
+    except KeyError:
+        text = text + '\nNo network connection'
+    if settings['oled_valves']:
+        open_valves = [str(channel_id) for channel_id, channel in digital_channels.items()
+                       if channel.enabled and channel.direction.startswith('output') and channel.read() == 1]
+        text = text + '\nOpen: ' + (' '.join(open_valves) if open_valves else '-')
+    for channel in list(serial_channels.values()):
+        for value in channel.listener_values():
+            if value['name'] in settings['oled_values']:
+                text = text + '\n%s: %s' % (value['name'], value['value'])
+    return text
+
+
+class OledDisplay:
+    """
+    Keeps the SSD1306 display open and redraws it on a background thread, sending only the changed pages.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._wake = Event()
+        self._running = False
+        self._oled = None
+        self._opened = None  # (address, width, height) the display was opened with
+        self._attempted = None  # (address, width, height) of the last failed attempt to open the display
+        self._retry_delay = 0  # seconds between attempts to open the display, doubled after each failure
+        self._retry_at = 0.0  # monotonic time of the next attempt
+        self._font = None
+        self._text = None  # text on the display
+        self._pages = []  # framebuffer pages on the display
+
+    def update(self):
+        """Asks the refresh thread to redraw the display now, starting the thread if it is not running."""
+        with self._lock:
+            if not self._running:
+                self._running = True
+                refresh_thread = Thread(target=self.refresher, daemon=True)
+                refresh_thread.name = 'OLED refresh'
+                refresh_thread.start()
+        self._wake.set()
+
+    def displaying(self):
+        """Returns True while the display is open."""
+        return self._oled is not None
+
+    def refresher(self):
+        """
+        Background loop redrawing the display every 'oled_refresh_interval' seconds or when woken. An error is logged
+        and the display is redrawn on the next pass, if the loop ends anyway the next update starts a new thread.
+        """
+        try:
+            while True:
+                self._wake.wait(settings['oled_refresh_interval'])
+                self._wake.clear()
+                try:
+                    self.refresh()
+                except OSError:
+                    logger.exception('OLED display write failed, the display will be opened again')
+                    self._oled = None
+                except Exception:  # pylint: disable=broad-exception-caught
+                    logger.exception('OLED display refresh failed')
+        finally:
+            with self._lock:
+                self._running = False
+
+    def open(self):
+        """
+        Opens the display with the current settings, returns False if it is not available.
+        """
+        opened = (settings['oled_address'], settings['oled_width'], settings['oled_height'])
+        if self._oled is not None and self._opened == opened:
+            return True
+        if opened != self._attempted:  # new settings are tried at once
+            self._retry_delay = 0
+            self._retry_at = 0.0
+        if monotonic() < self._retry_at:
+            return False
+        self._attempted = opened
         try:
+            # the display libraries are loaded when the display is first opened, which may be after a reload
+            import board  # pylint: disable=import-outside-toplevel
+            import adafruit_ssd1306  # pylint: disable=import-outside-toplevel
+            from PIL import ImageFont  # pylint: disable=import-outside-toplevel
             i2c = board.I2C()
-            oled = adafruit_ssd1306.SSD1306_I2C(settings['oled_width'], settings['oled_height'], i2c, addr=settings['oled_address'])
+            self._oled = adafruit_ssd1306.SSD1306_I2C(settings['oled_width'], settings['oled_height'], i2c,
+                                                      addr=settings['oled_address'])
+            if self._font is None:
+                self._font = ImageFont.load_default(11)
         except ValueError:
-            logger.error('OLED display not found at %s', settings['oled_address'])
+            if self._retry_delay == 0:  # logged once, not on every retry
+                logger.error('OLED display not found at %s', settings['oled_address'])
+            self._retry_delay = min(max(self._retry_delay * 2, 1), OPEN_RETRY_MAX)
+            self._retry_at = monotonic() + self._retry_delay
+            return False
+        except ImportError:
+            logger.info('Board library not installed - OLED not available ')
+            self._retry_at = float('inf')  # tried again when the display settings change
+            return False
+        if self._retry_delay:
+            logger.info('OLED display found at %s', settings['oled_address'])
+        self._retry_delay = 0
+        self._opened = opened
+        self._text = None
+        self._pages = []
+        return True
+
+    def refresh(self):
+        """
+        Draws the display text if it has changed and sends the pages of the framebuffer that differ from the
+        display. The display is cleared when it is disabled.
+        """
+        if not settings['oled_enabled']:
+            if self._oled is not None:
+                self._oled.fill(0)
+                self._oled.show()
+                self._oled = None
             return
-        except NameError:
-            logger.info('Board library not loaded - OLED not available ')
+        text = oled_text()
+        if not self.open() or text == self._text:
             return
+        from PIL import Image, ImageDraw  # pylint: disable=import-outside-toplevel
+        # Create blank image for drawing with mode '1' for 1-bit color.
+        image = Image.new("1", (self._oled.width, self._oled.height))
+        ImageDraw.Draw(image).text((1, 1), text, font=self._font, fill=255)
+        self._oled.image(image)
+        self._text = text
+        self.send_pages()
 
-        # Create blank image for drawing.
-        # Make sure to create image with mode '1' for 1-bit color.
-        image = Image.new("1", (oled.width, oled.height))
+    def send_pages(self):
+        """
+        Sends each run of changed framebuffer pages to the display with one I2C write, or the whole framebuffer if
+        the display uses page addressing.
+        """
+        oled = self._oled
+        width = oled.width
+        framebuffer = oled.buffer[1:]  # the first byte of the I2C buffer is the data control byte
+        pages = [bytes(framebuffer[page * width:(page + 1) * width]) for page in range(oled.pages)]
+        if getattr(oled, 'page_addressing', False) or len(self._pages) != len(pages):
+            oled.show()
+            self._pages = pages
+            return
+        column = COLUMN_OFFSETS.get(width, 0)
+        page = 0
+        while page < len(pages):
+            if pages[page] == self._pages[page]:
+                page += 1
+                continue
+            first = page
+            while page < len(pages) and pages[page] != self._pages[page]:
+                page += 1
+            for command in (SET_COL_ADDR, column, column + width - 1, SET_PAGE_ADDR, first, page - 1):
+                oled.write_cmd(command)
+            with oled.i2c_device:
+                oled.i2c_device.write(b'\x40' + b''.join(pages[first:page]))
+        self._pages = pages
 
-        # Get drawing object to draw on image.
-        draw = ImageDraw.Draw(image)
 
-        # Load default font.
-        font = ImageFont.load_default(11)
+oled_display = OledDisplay()
 
-        # Draw Text Image
-        netif = get_netifo()
-        if len(settings['app-name']) > 16:
-            text = settings['app-name'][:15] + '...'
-        else :
-            text = settings['app-name']
-        text = text + '\nVER: ' + VERSION
-        try:
-            text = text + '\n%s: %s' % (netif['connection.interface-name'],
-                                    netif['IP4.ADDRESS[1]'].split('/', maxsplit=1)[0])
-        except KeyError:
-            text = text + '\nNo network connection'
-        draw.text( (1, 1), text, font=font, fill=255)
 
-        # Display image
-        oled.image(image)
-        oled.show()
+def set_oled():
+    """
+    Asks the refresh thread to redraw the OLED display with the current system information, returns without
+    waiting for the display.
+    """
+    if settings['oled_enabled'] or oled_display.displaying():
+        oled_display.update()
+
 
 if __name__ == "__main__":
-    set_oled()
+    oled_display.refresh()
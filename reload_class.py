@@ -0,0 +1,79 @@
+"""
+Applies changed settings to the running controller without restarting gunicorn.
+
+The settings snapshots before and after a configuration change are compared and only the parts
+of the controller that use the changed settings are rebuilt: the digital channels whose settings
+changed (and the interlocks), the analogue channel map and sampler, the serial connections that
+were added, deleted or changed, the log level and the OLED display. The other channels, serial
+ports and requests in progress are not interrupted.
+
+Settings used to open files or load libraries at start up (RESTART_SETTINGS) still restart the
+gunicorn service, as does a reload that fails.
+
+Usage:
+    from reload_class import reloading
+    handler = reloading(set_digital_settings)  # applies the settings changed by each call
+"""
+
+from threading import RLock
+from app_control import current_settings
+from logmanager import logger, set_log_level
+from config_class import restart_services
+from digital_class import reload_digital_channels
+from analogue_class import reload_analogue
+from serial_class import reload_serial_channels
+from oled_class import set_oled
+
+DIGITAL_SETTINGS = ['digital_channels', 'interlocks']
+ANALOGUE_SETTINGS = ['analogue_channels', 'analogue_devices', 'analogue_i2c', 'analogue_data_rate']
+SERIAL_SETTINGS = ['serial_channels', 'serial_engine']
+OLED_SETTINGS = ['oled_enabled', 'oled_address', 'oled_height', 'oled_width', 'oled_valves', 'oled_values',
+                 'app-name']
+RESTART_SETTINGS = ['analogue_installed', 'analogue_simulate', 'logfilepath', 'logappname', 'gunicornpath',
+                    'datastore_enabled', 'datastore_path', 'digital_verify_interval']
+RELOAD_LOCK = RLock()  # one reload at a time
+
+
+def reload_settings(old, new):
+    """
+    Compares two settings snapshots and rebuilds the parts of the controller affected by the changed settings.
+    Returns the names of the changed settings.
+    """
+    changed = sorted(item for item in new if item != 'LastSave' and old.get(item) != new[item])
+    if not changed:
+        return changed
+    logger.info('Reload: settings changed %s', changed)
+    if any(item in RESTART_SETTINGS for item in changed):
+        restart_services()
+        return changed
+    try:
+        if 'loglevel' in changed:
+            set_log_level(new['loglevel'])
+            logger.info('Logging level set to: %s', new['loglevel'].upper())
+        if any(item in DIGITAL_SETTINGS for item in changed):
+            reload_digital_channels()
+        if any(item in ANALOGUE_SETTINGS for item in changed):
+            reload_analogue()
+        if any(item in SERIAL_SETTINGS for item in changed):
+            reload_serial_channels()
+        if any(item in OLED_SETTINGS for item in changed):
+            set_oled()
+    except Exception:  # pylint: disable=broad-exception-caught
+        logger.exception('Reload: settings could not be applied in place, restarting')
+        restart_services()
+    return changed
+
+
+def reloading(function):
+    """
+    Returns function wrapped so that the settings it changes are applied to the running controller.
+    """
+    def reload_wrapper(*args, **kwargs):
+        with RELOAD_LOCK:
+            old = current_settings()
+            result = function(*args, **kwargs)
+            reload_settings(old, current_settings())
+        return result
+    reload_wrapper.__name__ = function.__name__
+    reload_wrapper.__doc__ = function.__doc__
+    return reload_wrapper
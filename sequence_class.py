@@ -0,0 +1,177 @@
+"""
+Timed valve sequences run on the controller.
+
+A sequence is a list of steps, each step either sets a digital channel or waits:
+    'digital2 open'    sets a channel using the digital on and off commands
+    'wait 2.5s'        waits, also 'wait 250ms'
+
+Named sequences are kept in settings['sequences'] and are started with one API call. They run on
+a dedicated executor thread that schedules every step from the start time of the sequence, using a
+sleep followed by a short spin on the high resolution clock, so the timing does not depend on the
+network or on the web server and errors do not add up along the sequence. Channels are set with
+ChannelObject.write so the interlocks are respected; a step that is refused stops the sequence.
+The report of each run gives the planned and actual time of every step.
+
+Usage (API item 'sequence'):
+    {"item": "sequence", "command": "ar-pipette"}              start a named sequence
+    {"item": "sequence", "command": ["digital2 open", ...]}    start a list of steps
+    {"item": "sequence", "command": "status"}                  report of the running or last sequence
+    {"item": "sequence", "command": "stop"}                    stop the running sequence
+    {"item": "sequence", "command": "list"}                    names and steps of the named sequences
+"""
+
+import re
+from queue import Queue
+from threading import Thread, Event, Lock
+from time import perf_counter, time
+from app_control import settings
+from logmanager import logger
+from digital_class import digital_channels
+
+SPIN_TIME = 0.002  # seconds before a step that are spent spinning on the clock rather than sleeping
+WAIT_STEP = re.compile(r'^wait\s+([0-9]*\.?[0-9]+)\s*(ms|s)?$')
+
+
+def parse_steps(steps):
+    """
+    Converts a list of step strings into a list of (step, planned time, channel, command) tuples, where planned time
+    is seconds from the start of the sequence and wait steps have no channel. Raises ValueError for a step that
+    is not valid.
+    """
+    if not isinstance(steps, list) or not steps:
+        raise ValueError('a sequence must be a list of steps')
+    parsed = []
+    planned = 0.0
+    commands = [settings['digital_on_command'], settings['digital_off_command']]
+    for step in steps:
+        words = str(step).strip().split()
+        wait = WAIT_STEP.match(' '.join(words).lower())
+        if wait:
+            planned += float(wait.group(1)) / (1000 if wait.group(2) == 'ms' else 1)
+            parsed.append((step, planned, None, None))
+            continue
+        if len(words) != 2 or not words[0].startswith(settings['digital_prefix']) or words[1] not in commands:
+            raise ValueError('step "%s" is not valid' % step)
+        try:
+            channel = int(words[0][len(settings['digital_prefix']):])
+        except ValueError:
+            raise ValueError('step "%s" is not valid' % step) from None
+        if channel not in digital_channels:
+            raise ValueError('step "%s": no digital channel %d' % (step, channel))
+        parsed.append((step, planned, digital_channels[channel], words[1]))
+    return parsed
+
+
+class SequenceExecutor:
+    """
+    Runs one sequence at a time on a dedicated thread and keeps the report of the running or last sequence.
+    """
+    def __init__(self):
+        self._queue = Queue()
+        self._lock = Lock()
+        self._stop = Event()
+        self._running = False
+        self._report = {'name': '', 'state': 'idle', 'steps': []}
+        executor_thread = Thread(target=self.executor, daemon=True)
+        executor_thread.name = 'Sequence executor'
+        executor_thread.start()
+
+    def start(self, name, steps):
+        """
+        Validates a sequence and queues it to run, returns an error message or '' if it was started.
+        """
+        try:
+            parsed = parse_steps(steps)
+        except ValueError as exception:
+            return str(exception)
+        with self._lock:
+            if self._running:
+                return 'sequence "%s" is already running' % self._report['name']
+            self._running = True
+            self._stop.clear()
+            self._report = {'name': name, 'state': 'queued', 'steps': []}
+        self._queue.put((name, parsed))
+        return ''
+
+    def stop(self):
+        """Stops the running sequence before its next step."""
+        self._stop.set()
+
+    def report(self):
+        """Returns the report of the running or last sequence."""
+        return self._report
+
+    def wait_until(self, target):
+        """
+        Waits until the perf_counter time target, sleeping until SPIN_TIME before it and then spinning. Returns
+        False if the sequence was stopped.
+        """
+        remaining = target - perf_counter() - SPIN_TIME
+        if remaining > 0 and self._stop.wait(remaining):
+            return False
+        while perf_counter() < target:
+            pass
+        return not self._stop.is_set()
+
+    def executor(self):
+        """Background loop running the queued sequences."""
+        while True:
+            name, parsed = self._queue.get()
+            self.run(name, parsed)
+
+    def run(self, name, parsed):
+        """
+        Runs a parsed sequence, each step is done at its planned time from the start of the sequence.
+        """
+        steps = []
+        report = {'name': name, 'state': 'running', 'started': time(), 'steps': steps, 'max_error': 0.0}
+        self._report = report
+        logger.info('Sequence "%s" started', name)
+        start = perf_counter()
+        for step, planned, channel, command in parsed:
+            if not self.wait_until(start + planned):
+                report['state'] = 'stopped'
+                logger.warning('Sequence "%s" stopped before step "%s"', name, step)
+                break
+            actual = perf_counter() - start
+            error = channel.write(command) if channel else ''
+            steps.append({'step': step, 'planned': round(planned, 6), 'actual': round(actual, 6),
+                          'error': error[-1] if isinstance(error, tuple) else error})
+            if error:
+                report['state'] = 'failed'
+                logger.warning('Sequence "%s" failed at step "%s"', name, step)
+                break
+        else:
+            report['state'] = 'complete'
+        report['max_error'] = round(max((abs(item['actual'] - item['planned']) for item in steps), default=0.0), 6)
+        logger.info('Sequence "%s" %s, %d steps, largest timing error %.3f ms', name, report['state'], len(steps),
+                    report['max_error'] * 1000)
+        with self._lock:
+            self._running = False
+
+
+def sequence_api(item, command):
+    """
+    Handles the 'sequence' api item: starts a named sequence or a list of steps, or returns the status, stops the
+    running sequence or lists the named sequences.
+    """
+    if command == 'status':
+        return {'item': item, 'command': command, 'values': sequence_executor.report()}
+    if command == 'stop':
+        sequence_executor.stop()
+        return {'item': item, 'command': command, 'values': sequence_executor.report()}
+    if command == 'list':
+        return {'item': item, 'command': command, 'values': settings['sequences']}
+    if isinstance(command, list):
+        error = sequence_executor.start('api', command)
+    elif isinstance(command, str) and command in settings['sequences']:
+        error = sequence_executor.start(command, settings['sequences'][command])
+    else:
+        error = 'sequence "%s" not found' % command
+    if error:
+        logger.warning('Sequence: %s', error)
+        return {'item': item, 'command': command, 'exception': error, 'values': sequence_executor.report()}
+    return {'item': item, 'command': command, 'values': sequence_executor.report()}
+
+
+sequence_executor = SequenceExecutor()
@@ -11,11 +11,14 @@ Key Features:
     - Listener mode for passive data acquisition with configurable polling
     - Base64 encoding/decoding for message storage and transmission
     - Automatic message parsing and value extraction
-    - Thread-safe operations with built-in retry mechanisms
+    - Per-port priority transaction queue, API commands go ahead of listener polls
+    - Bounded in-memory history of listener readings (api item <api-name>history)
     - Dynamic port discovery and configuration management
 
 Classes:
     SerialConnection: Main class for managing individual serial port connections
+    AsyncSerialConnection: SerialConnection driven by the shared asyncio engine
+    AsyncSerialEngine: Single event loop thread that runs every asyncio serial channel
 
 Functions:
     Configuration Management:
@@ -31,7 +34,9 @@ Functions:
         - serial_http_data: Aggregate data from all configured channels
 
 Communication Modes:
-    Interactive: Send commands and read responses with configurable timing
+    Interactive: Send commands and read responses, replies are framed by a terminator,
+                 an expected length or an inter-byte timeout so reads return as soon as
+                 the reply is complete
     Listener: Continuously monitor incoming data and extract specific values
 
 Usage:
@@ -40,15 +45,28 @@ Usage:
     accessed via the serial_http_data() function or individual channel instances.
 """
 from ast import literal_eval
-from time import sleep
-from threading import Thread
+from copy import deepcopy
+import asyncio
+from time import sleep, monotonic
+from threading import Thread, Lock
+from queue import PriorityQueue
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from itertools import count
 from base64 import b64decode, b64encode
 from datetime import datetime
 import glob
 import sys
 import serial  # from pyserial
 from logmanager import logger
-from app_control import settings, writesettings, friendlyname, jscriptname
+from app_control import settings, current_settings, settings_update, friendlyname, jscriptname
+from history_class import RingBuffer, reading_value, history_window
+from datastore_class import data_store
+
+API_PRIORITY = 0  # operator commands go ahead of background polls
+LISTENER_PRIORITY = 1
+TRANSACTION_TIMEOUT = 30  # seconds a caller waits for its place in the port queue
+PORT_TIMEOUT = 1  # seconds a read waits for a reply
+SERIAL_ENGINE = None  # asyncio engine, created when the first asyncio channel starts
 
 
 def str_encode(string):
@@ -73,6 +91,30 @@ def str_decode(string):
     return b64decode(string)
 
 
+def bytes_decode(binary_data):
+    """
+    Converts raw bytes read from a serial port into a string.
+
+    UTF-8 is tried first, if the device returns non unicode characters the data is
+    decoded as ISO-8859-1 so that every byte maps to a character.
+    """
+    try:
+        return str(binary_data, 'utf-8')
+    except UnicodeDecodeError:
+        return str(binary_data, 'iso-8859-1')
+
+
+def binary_setting(string):
+    """
+    Converts a binary value entered on the web form (e.g. b'\\r') to bytes, if the value is not
+    enclosed in b'  ' it is treated as the content of a binary string.
+    """
+    try:
+        return literal_eval(string)
+    except (ValueError, SyntaxError):
+        return literal_eval("b'%s'" % string)
+
+
 def update_serial_channel(serial_config):
     """
     Updates the serial channel settings with given new settings.
@@ -87,19 +129,15 @@ def update_serial_channel(serial_config):
     serial_channel= {'api-name': friendlyname(serial_config['api-name']), 'port': serial_config['port'],
                      'mode': serial_config['mode'], 'baud': int(serial_config['baud']),
                      'poll_interval': int(serial_config['poll_interval']), 'messages': []}
-    if len(settings['serial_channels']) == 0:
-        settings['serial_channels'] = [serial_channel]
-        writesettings()
-        return serial_channel
-    for conn in settings['serial_channels']:
-        if conn['port'] == serial_config['port']:
-            serial_channel['messages'] = conn['messages']
-        else:
-            serial_channel_list.append(conn)
-    serial_channel_list.append(serial_channel)
-    serial_channel_list.sort(key=lambda x: x['api-name'])
-    settings['serial_channels'] = serial_channel_list
-    writesettings()
+    with settings_update() as new_settings:
+        for conn in new_settings['serial_channels']:
+            if conn['port'] == serial_config['port']:
+                serial_channel['messages'] = conn['messages']
+            else:
+                serial_channel_list.append(conn)
+        serial_channel_list.append(serial_channel)
+        serial_channel_list.sort(key=lambda x: x['api-name'])
+        new_settings['serial_channels'] = serial_channel_list
     logger.info('Serial Class: serial channel %s updated', serial_config['port'])
     return serial_channel
 
@@ -115,11 +153,11 @@ def delete_serial_channel(port_id):
     list of channels.
     """
     serial_channel_list = []
-    for conn in settings['serial_channels']:
-        if conn['port'] != port_id:
-            serial_channel_list.append(conn)
-    settings['serial_channels'] = serial_channel_list
-    writesettings()
+    with settings_update() as new_settings:
+        for conn in new_settings['serial_channels']:
+            if conn['port'] != port_id:
+                serial_channel_list.append(conn)
+        new_settings['serial_channels'] = serial_channel_list
     logger.info('Serial Class: serial channel %s deleted', port_id)
     return serial_channel_list
 
@@ -134,25 +172,23 @@ def update_serial_message(serial_message):
     manages the organization of messages for a serial channel.
     """
     print(serial_message['string1'], serial_message['string2'])
-    try:
-        string1 = literal_eval(serial_message['string1'])
-    except (ValueError, SyntaxError):
-        string1 = literal_eval("b'%s'" % serial_message['string1'])
-    try:
-        string2 = literal_eval(serial_message['string2'])
-    except (ValueError, SyntaxError):
-        string2 = literal_eval("b'%s'" % serial_message['string2'])
+    string1 = binary_setting(serial_message['string1'])
+    string2 = binary_setting(serial_message['string2'])
+    terminator = binary_setting(serial_message.get('terminator', ''))
     message_list = [{'name': serial_message['name'], 'string1': str_encode(string1),
                     'string2': str_encode(string2), 'start': int(serial_message['start']),
-                    'length': int(serial_message['length']), 'api-command': friendlyname(serial_message['api-command'])}]
-    for conn in settings['serial_channels']:
-        if conn['port'] == serial_message['port']:
-            for message in conn['messages']:
-                if message['name'] != serial_message['name']:
-                    message_list.append(message)
-            message_list.sort(key=lambda x: x['name'])
-            conn['messages'] = message_list
-    writesettings()
+                    'length': int(serial_message['length']), 'api-command': friendlyname(serial_message['api-command']),
+                    'terminator': str_encode(terminator),
+                    'reply_length': int(serial_message.get('reply_length', 0) or 0),
+                    'inter_byte_timeout': float(serial_message.get('inter_byte_timeout', 0) or 0)}]
+    with settings_update() as new_settings:
+        for conn in new_settings['serial_channels']:
+            if conn['port'] == serial_message['port']:
+                for message in conn['messages']:
+                    if message['name'] != serial_message['name']:
+                        message_list.append(message)
+                message_list.sort(key=lambda x: x['name'])
+                conn['messages'] = message_list
     logger.info('Serial Class: serial message %s added to %s', serial_message['name'], serial_message['port'])
     return message_list
 
@@ -167,13 +203,13 @@ def delete_serial_message(serial_message):
     informational log message is generated.
     """
     messages_list = []
-    for conn in settings['serial_channels']:
-        if conn['port'] == serial_message['port']:
-            for message in conn['messages']:
-                if message['name'] != serial_message['name']:
-                    messages_list.append(message)
-            conn['messages'] = messages_list
-    writesettings()
+    with settings_update() as new_settings:
+        for conn in new_settings['serial_channels']:
+            if conn['port'] == serial_message['port']:
+                for message in conn['messages']:
+                    if message['name'] != serial_message['name']:
+                        messages_list.append(message)
+                conn['messages'] = messages_list
     logger.info('Serial Class: serial message %s deleted from %s', serial_message['name'], serial_message['port'])
     return messages_list
 
@@ -199,7 +235,10 @@ def serial_port_info(port_id):
             for message in conn['messages']:
                 messages.append({'api-command': message['api-command'], 'name': message['name'], 'string1': str_decode(message['string1']),
                                  'string2': str_decode(message['string2']), 'start': message['start'],
-                                 'length': message['length']})
+                                 'length': message['length'],
+                                 'terminator': str_decode(message.get('terminator', '')),
+                                 'reply_length': message.get('reply_length', 0),
+                                 'inter_byte_timeout': message.get('inter_byte_timeout', 0)})
             serial_details['configured'] = True
             serial_details['messages'] = messages
     return serial_details
@@ -245,13 +284,20 @@ class SerialConnection:
     for interactive and non-interactive (listener) modes. The class allows users to automate
     polling of devices and processing of incoming data based on predefined configurations.
     """
+    ENGINE = 'thread'
+
     def __init__(self, device):
+        self.config = deepcopy(device)  # the settings the connection was built with
+        self._closed = False
+        self._close_lock = Lock()  # a transaction is never queued after close() has stopped the worker
         self._port_ready = False
         self._baud_rate = device['baud']
         self._port = device['port']
         self.port = None
         self._mode = device['mode']
-        self._active = False
+        self._transactions = PriorityQueue()
+        self._sequence = count()
+        self._queue_stats = {'completed': 0, 'last_wait': 0.0, 'max_wait': 0.0, 'total_wait': 0.0}
         self._name = device['api-name']
         if self._mode == 'interactive':
             self._read_buffer = 256
@@ -262,18 +308,24 @@ class SerialConnection:
         self._listener_messages = []
         self._api_messages = []
         self._listener_values = []
+        self._history = {}
         for message in device['messages']:
+            framing = {'terminator': str_decode(message.get('terminator', '')),
+                       'reply_length': message.get('reply_length', 0),
+                       'inter_byte_timeout': message.get('inter_byte_timeout', 0)}
             if message['api-command'] == '':
                 self._listener_messages.append({'name': message['name'], 'string1': message['string1'],
                                                 'string2': message['string2'], 'start': message['start'],
-                                                'length': message['length']})
+                                                'length': message['length'], **framing})
                 self._listener_values.append({'name': message['name'], 'port': self._port, 'value': '0',
                                               'portstatus': '%s Not Ready' % self._port, "read_time": "01-01-1979 00:00:00"})
+                self._history[message['name']] = RingBuffer(settings['serial_history_length'])
                 logger.info('Serial Class: %s, listener message registered: %s', self._port, message['name'])
             else:
                 self._api_messages.append({'name': message['name'], 'string1': message['string1'],
                                            'string2': message['string2'], 'start': message['start'],
-                                           'length': message['length'], 'api-command': message['api-command']})
+                                           'length': message['length'], 'api-command': message['api-command'],
+                                           **framing})
                 logger.info('Serial Class: %s, api message registered: %s', self._port, message['api-command'])
         self.init_port()
 
@@ -285,11 +337,14 @@ class SerialConnection:
         marked as ready. If the connection fails, the port is marked as not ready.
         """
         try:
-            self.port = serial.Serial(self._port, self._baud_rate, timeout=1)
+            self.port = serial.Serial(self._port, self._baud_rate, timeout=PORT_TIMEOUT)
             self.port.reset_input_buffer()
             self._port_ready = True
             print('Serial Class: %s connected' % self._port)
             logger.info('Serial Class: %s connected', self._port)
+            worker_thread = Thread(target=self.transaction_worker, daemon=True)
+            worker_thread.name = 'Serial transactions %s' % self._name
+            worker_thread.start()
             if len(self._listener_messages) > 0:
                 reader_thread = Thread(target=self.listener_timer, daemon=True)
                 reader_thread.name = 'Serial listener %s' % self._name
@@ -304,84 +359,211 @@ class SerialConnection:
         """
         return self._name
 
+    def close(self):
+        """
+        Stops the transaction worker and listener threads and closes the port, used when the channel is rebuilt
+        with new settings.
+        """
+        with self._close_lock:
+            self._closed = True
+            self._port_ready = False
+            self._transactions.put((-1, next(self._sequence), monotonic(), None, None))
+        if self.port is not None:
+            self.port.close()
+        logger.info('Serial Class: %s closed', self._port)
+
     def listener_timer(self):
         """
         Reads data from a serial port in a loop with a specified polling interval. The behavior
         differs based on the mode of operation ('listener' or otherwise). If in 'listener' mode,
         it processes incoming data to extract specific substrings based on predefined message definitions.
         """
-        while True:
+        while not self._closed:
             try:
-                retry_count = 0
-                while self._active:
-                    sleep(0.1)
-                    retry_count += 1
-                    if retry_count > 10:
-                        logger.warning('Serial Class: Listener waiting for more than 1s for port %s to become free on', self._port)
-                        break
-                self._active = True
                 listener_values = []
-                self.port.reset_input_buffer()
                 if self._mode == 'interactive':
                     for item in self._listener_messages:
-                        self.port.write(b64decode(item['string1']))
-                        sleep(0.5)
-                        binary_data = self.port.read(size=self._read_buffer)
-                        if settings['serial_debug']:
-                            logger.info('Serial Class: Interactive string 1 binary data: %s', binary_data)
-                        try:
-                            string_data = str(binary_data, 'utf-8')
-                        except UnicodeDecodeError:
-                            string_data = str(binary_data, 'iso-8859-1')
-                        if item['string2']:
-                            self.port.write(b64decode(item['string2']))
-                            sleep(0.5)
-                            binary_data = self.port.read(size=self._read_buffer)
-                            if settings['serial_debug']:
-                                logger.info('Serial Class: Interactive string 2 binary data: %s', binary_data)
-                                try:
-                                    string_data = str(binary_data, 'utf-8')
-                                except UnicodeDecodeError:
-                                    string_data = str(binary_data, 'iso-8859-1')
-                        listener_values.append({'name': item['name'], 'port': self._port,
-                                                'value': string_data[item['start']:item['length']],
-                                                'portstatus': '%s (%s)' %(self._name, self._port),
-                                                "read_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+                        string_data = self.submit(lambda message=item: self.transaction(message, 'Interactive'),
+                                                  LISTENER_PRIORITY).result(timeout=TRANSACTION_TIMEOUT)
+                        listener_values.append(self.interactive_value(item, string_data))
                 else:
-                    binary_data = self.port.read(size=self._read_buffer)
-                    if settings['serial_debug']:
-                        logger.info('Serial Class: Listener binary data: %s', binary_data)
-                    try:
-                        string_data = str(binary_data, 'utf-8')
-                    except UnicodeDecodeError:
-                        string_data = str(binary_data, 'iso-8859-1')
+                    string_data = self.submit(self.listen, LISTENER_PRIORITY).result(timeout=TRANSACTION_TIMEOUT)
                     for item in self._listener_messages:
-                        name = item['name']
-                        findstring = str_decode(item['string1']).decode('utf-8')
-                        length = item['length']
-                        position = string_data.find(findstring)
-                        if position > -1:
-                            listener_values.append({'name': name,  'port': self._port,
-                                          'value': string_data[position + len(findstring):position + len(findstring) + length - 1],
-                                                'portstatus': '%s (%s)' %(self._name, self._port),
-                                                "read_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
-                        else:
-                            listener_values.append({'name': name, 'port': self._port,
-                                                    'value': '', 'portstatus': '%s (%s)' %(self._name, self._port),
-                                                    "read_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
-                logger.debug('Serial Class: Serial Return "%s" from %s', self._listener_values, self._port)
-                self._active = False
-                if len(listener_values) > 0:
-                    logger.debug('Serial Class: Listener Return "%s" from %s', listener_values, self._port)
-                    self._listener_values = listener_values
-            except serial.SerialException :
-                self._active = False
+                        listener_values.append(self.listener_value(item, string_data))
+                self.update_listener_values(listener_values)
+            except Exception:  # pylint: disable=broad-exception-caught
+                if self._closed:
+                    return
                 logger.exception('Serial Class: Listener Read Error on %s: %s', self._port, Exception)
             sleep_counter = 0
-            while sleep_counter < self._poll_interval:
+            while sleep_counter < self._poll_interval and not self._closed:
                 sleep_counter += 1
                 sleep(1)
 
+    def interactive_value(self, item, string_data):
+        """
+        Builds the listener value for an interactive message from the reply, the value is the slice of the
+        reply between the start and length positions of the message.
+        """
+        return {'name': item['name'], 'port': self._port,
+                'value': string_data[item['start']:item['length']],
+                'portstatus': '%s (%s)' %(self._name, self._port),
+                "read_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+
+    def listener_value(self, item, string_data):
+        """
+        Builds the listener value for a listener message by finding the search string in the data read
+        from the bus and returning the characters that follow it.
+        """
+        findstring = str_decode(item['string1']).decode('utf-8')
+        length = item['length']
+        position = string_data.find(findstring)
+        if position > -1:
+            return {'name': item['name'],  'port': self._port,
+                    'value': string_data[position + len(findstring):position + len(findstring) + length - 1],
+                    'portstatus': '%s (%s)' %(self._name, self._port),
+                    "read_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        return {'name': item['name'], 'port': self._port,
+                'value': '', 'portstatus': '%s (%s)' %(self._name, self._port),
+                "read_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+
+    def update_listener_values(self, listener_values):
+        """
+        Replaces the current listener values with those from the latest poll.
+        """
+        logger.debug('Serial Class: Serial Return "%s" from %s', self._listener_values, self._port)
+        if len(listener_values) > 0:
+            logger.debug('Serial Class: Listener Return "%s" from %s', listener_values, self._port)
+            self._listener_values = listener_values
+            for value in listener_values:
+                reading = reading_value(value['value'])
+                if reading is not None and value['name'] in self._history:
+                    self._history[value['name']].append(reading)
+                    data_store.record('%s-%s' % (self._name, friendlyname(value['name'])), reading)
+
+    def history(self, command):
+        """
+        Returns the listener readings held in the history ring buffers for the time window given by command,
+        see history_class.history_window.
+        """
+        start, end = history_window(command)
+        history_values = {}
+        for name, ring in self._history.items():
+            times, values = ring.window(start, end)
+            history_values[name] = {'time': times.tolist(), 'value': values.tolist()}
+        return history_values
+
+    def record_wait(self, queued_time):
+        """
+        Records how long a transaction waited in the queue before it was given the port.
+        """
+        wait_time = monotonic() - queued_time
+        self._queue_stats['completed'] += 1
+        self._queue_stats['last_wait'] = wait_time
+        self._queue_stats['total_wait'] += wait_time
+        self._queue_stats['max_wait'] = max(self._queue_stats['max_wait'], wait_time)
+
+    def submit(self, function, priority):
+        """
+        Queues a transaction on this port and returns a Future for its result. Transactions run one at a
+        time in priority order (API_PRIORITY before LISTENER_PRIORITY) and in the order they were
+        submitted within a priority, so an API command can never interleave with a listener poll.
+        """
+        future = Future()
+        with self._close_lock:
+            if self._closed:
+                future.set_exception(serial.SerialException('%s is closed' % self._port))
+            else:
+                self._transactions.put((priority, next(self._sequence), monotonic(), function, future))
+        return future
+
+    def transaction_worker(self):
+        """
+        Runs the queued transactions for this port, recording how long each one waited in the queue.
+        """
+        while True:
+            _, _, queued_time, function, future = self._transactions.get()
+            if function is None:  # queued by close(), the transactions still queued fail
+                self.fail_queued(self._transactions.get_nowait, self._transactions.empty)
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.record_wait(queued_time)
+            try:
+                future.set_result(function())
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                future.set_exception(error)
+
+    def fail_queued(self, get_nowait, empty):
+        """
+        Takes the transactions left in the queue when the port is closed and fails each one with a SerialException.
+        """
+        while not empty():
+            future = get_nowait()[4]
+            if future is not None and not future.done():
+                future.set_exception(serial.SerialException('%s is closed' % self._port))
+
+    def queue_info(self):
+        """
+        Returns the depth of the transaction queue and the time transactions have waited for the port.
+        """
+        completed = self._queue_stats['completed']
+        return {'port': self._port, 'depth': self._transactions.qsize(), 'completed': completed,
+                'last_wait': round(self._queue_stats['last_wait'], 4),
+                'max_wait': round(self._queue_stats['max_wait'], 4),
+                'mean_wait': round(self._queue_stats['total_wait'] / completed, 4) if completed else 0.0}
+
+    def listen(self):
+        """
+        Reads the data on the bus for a listener mode port and returns it as a string.
+        """
+        self.port.reset_input_buffer()
+        binary_data = self.port.read(size=self._read_buffer)
+        if current_settings()['serial_debug']:
+            logger.info('Serial Class: Listener binary data: %s', binary_data)
+        return bytes_decode(binary_data)
+
+    def read_reply(self, message):
+        """
+        Reads the reply to a message that has just been written to the serial port. The read returns as soon
+        as the reply is complete using the framing options of the message:
+
+        - terminator: read until the terminator bytes (e.g. b'\\r') are received
+        - reply_length: read until the expected number of bytes are received
+        - inter_byte_timeout: read until the line has been quiet for this many seconds
+
+        The port timeout still limits the total time waited. Messages with no framing options keep the
+        original behaviour of waiting 0.5 seconds before reading the buffer.
+        """
+        inter_byte_timeout = message['inter_byte_timeout'] if message['inter_byte_timeout'] > 0 else None
+        if self.port.inter_byte_timeout != inter_byte_timeout:
+            self.port.inter_byte_timeout = inter_byte_timeout
+        if message['terminator']:
+            return self.port.read_until(message['terminator'], self._read_buffer)
+        if message['reply_length'] > 0:
+            return self.port.read(size=message['reply_length'])
+        if inter_byte_timeout is None:
+            sleep(0.5)
+        return self.port.read(size=self._read_buffer)
+
+    def transaction(self, message, source):
+        """
+        Writes string1 (and string2 if present) of a message to the serial port and returns the decoded
+        reply to the last string sent. Must only be called from the transaction worker via submit().
+        """
+        debug = current_settings()['serial_debug']
+        self.port.reset_input_buffer()
+        self.port.write(b64decode(message['string1']))
+        binary_data = self.read_reply(message)
+        if debug:
+            logger.info('Serial Class: %s string 1 binary data: %s', source, binary_data)
+        if message['string2']:
+            self.port.write(b64decode(message['string2']))
+            binary_data = self.read_reply(message)
+            if debug:
+                logger.info('Serial Class: %s string 2 binary data: %s', source, binary_data)
+        return bytes_decode(binary_data)
+
     def api_command(self, item, command):
         """
         Executes a specified API command by sending encoded data via a serial port and reads back the
@@ -390,26 +572,27 @@ class SerialConnection:
         the operation.
 
         The method handles errors related to the serial port and returns a descriptive error message if
-        a SerialException occurs or if the serial port is not ready.
+        a SerialException occurs or if the serial port is not ready. The command is queued ahead of any
+        listener polls waiting for the port.
         """
+        if not self._port_ready:
+            return {'item': item, 'command': command, 'values': '', 'exception': 'Serial Port Error or not ready'}
         try:
             for message_item in self._api_messages:
                 if message_item['api-command'] == command:
-                    self.port.write(b64decode(message_item['string1']))
-                    sleep(0.5)
-                    binary_data = self.port.read(size=self._read_buffer)
-                    if settings['serial_debug']:
-                        logger.info('Serial Class: api string 1 binary data: %s', binary_data)
-                    string_data = str(binary_data, 'utf-8')
-                    if message_item['string2']:
-                        self.port.write(b64decode(message_item['string2']))
-                        sleep(0.5)
-                        binary_data = self.port.read(size=self._read_buffer)
-                        if settings['serial_debug']:
-                            logger.info('Serial Class: api string 1 binary data: %s', binary_data)
-                        string_data = str(binary_data, 'utf-8')
+                    future = self.submit(lambda message=message_item: self.transaction(message, 'api'),
+                                         API_PRIORITY)
+                    try:
+                        string_data = future.result(timeout=TRANSACTION_TIMEOUT)
+                    except FutureTimeoutError:
+                        if future.cancel():  # still queued, the worker skips it so it is never sent
+                            raise
+                        string_data = future.result()  # already sent, its reply is bounded by the port timeout
                     return {'item': item,'command': command, 'values': string_data}
             return {'item': item, 'command': command, 'values': '', 'exception': 'Command not found'}
+        except FutureTimeoutError:
+            logger.error('Serial Class: API Command on %s timed out waiting for the port and was cancelled', self._port)
+            return {'item': item, 'command': command, 'values': '', 'exception': 'Serial Port busy'}
         except serial.SerialException :
             logger.exception('Serial Class: API Command Error on %s: %s', self._port, Exception)
             return {'item': item, 'command': command, 'values': '', 'exception': 'Serial Port Error or not ready'}
@@ -433,6 +616,279 @@ class SerialConnection:
             self._poll_interval = self._default_poll_interval
 
 
+class AsyncSerialEngine:  # pylint: disable=too-few-public-methods
+    """
+    Runs a single asyncio event loop on one thread that drives every asyncio serial channel, replacing
+    the transaction and listener threads each SerialConnection would otherwise start.
+    """
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        engine_thread = Thread(target=self.loop.run_forever, daemon=True)
+        engine_thread.name = 'Serial asyncio engine'
+        engine_thread.start()
+        logger.info('Serial Class: asyncio serial engine started')
+
+    def run(self, coroutine):
+        """
+        Schedules a coroutine on the engine loop from any thread and returns a concurrent Future for its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+
+def serial_engine():
+    """
+    Returns the asyncio serial engine, starting it the first time it is needed.
+    """
+    global SERIAL_ENGINE
+    if SERIAL_ENGINE is None:
+        SERIAL_ENGINE = AsyncSerialEngine()
+    return SERIAL_ENGINE
+
+
+class AsyncSerialConnection(SerialConnection):
+    """
+    A SerialConnection that runs its polls and API transactions as tasks on the shared AsyncSerialEngine
+    loop. The port is opened non-blocking and the loop is notified when data arrives, so no thread is
+    blocked waiting for a device. The listener values, API replies and queue information are the same as
+    those of a SerialConnection so serial_api_parser and serial_http_data are unchanged.
+
+    Selected by setting 'serial_engine' to 'asyncio'.
+    """
+    ENGINE = 'asyncio'
+
+    def __init__(self, device):
+        self._tasks = []  # the worker and listener tasks on the engine loop
+        super().__init__(device)
+
+    def init_port(self):
+        """
+        Opens the serial port in non-blocking mode and starts the channel on the asyncio serial engine.
+        """
+        try:
+            self.port = serial.Serial(self._port, self._baud_rate, timeout=0)
+            self.port.reset_input_buffer()
+            self._port_ready = True
+            print('Serial Class: %s connected' % self._port)
+            logger.info('Serial Class: %s connected (asyncio)', self._port)
+            self._rx_buffer = bytearray()
+            self._rx_time = monotonic()
+            self._rx_event = None
+            self._transactions = asyncio.PriorityQueue()  # bound to the engine loop when first used
+            serial_engine().run(self.start())
+        except serial.SerialException:
+            self._port_ready = False
+            logger.error('Serial Class: %s not connected', self._port)
+
+    async def start(self):
+        """
+        Registers the port with the event loop and starts the transaction worker and listener tasks.
+        """
+        loop = asyncio.get_running_loop()
+        self._rx_event = asyncio.Event()
+        loop.add_reader(self.port.fileno(), self.data_received)
+        self._tasks = [loop.create_task(self.async_worker())]
+        if len(self._listener_messages) > 0:
+            self._tasks.append(loop.create_task(self.async_listener()))
+
+    def close(self):
+        """
+        Removes the port from the asyncio serial engine, cancels its tasks and closes the port, used when the
+        channel is rebuilt with new settings.
+        """
+        with self._close_lock:
+            self._closed = True
+            self._port_ready = False
+        if self.port is not None:
+            serial_engine().run(self.async_close()).result(timeout=TRANSACTION_TIMEOUT)
+        logger.info('Serial Class: %s closed', self._port)
+
+    async def async_close(self):
+        """Removes the port reader and cancels the worker and listener tasks on the engine loop."""
+        if self.port.is_open:
+            asyncio.get_running_loop().remove_reader(self.port.fileno())
+        for task in self._tasks:
+            task.cancel()
+        self.fail_queued(self._transactions.get_nowait, self._transactions.empty)
+        self.port.close()
+
+    def data_received(self):
+        """
+        Called by the event loop when the port is readable, appends the waiting bytes to the receive buffer.
+        """
+        try:
+            binary_data = self.port.read(self.port.in_waiting or 1)
+        except serial.SerialException:
+            logger.exception('Serial Class: Read Error on %s, port removed from the asyncio engine', self._port)
+            asyncio.get_running_loop().remove_reader(self.port.fileno())
+            self._port_ready = False
+            return
+        if binary_data:
+            self._rx_buffer += binary_data
+            self._rx_time = monotonic()
+            self._rx_event.set()
+
+    def clear_rx_buffer(self):
+        """
+        Discards any data waiting on the port, the asyncio equivalent of reset_input_buffer.
+        """
+        self.port.reset_input_buffer()
+        self._rx_buffer.clear()
+
+    async def async_read_reply(self, message):
+        """
+        Waits for the reply to a message using the same framing rules as SerialConnection.read_reply and
+        returns it, leaving any bytes after the reply in the receive buffer.
+        """
+        terminator = message['terminator']
+        reply_length = message['reply_length'] if message['reply_length'] > 0 else self._read_buffer
+        gap = message['inter_byte_timeout']
+        if not terminator and message['reply_length'] <= 0 and gap <= 0:
+            await asyncio.sleep(0.5)
+        deadline = monotonic() + PORT_TIMEOUT
+        reply_end = None
+        while reply_end is None:
+            position = self._rx_buffer.find(terminator) if terminator else -1
+            now = monotonic()
+            if position > -1:
+                reply_end = min(position + len(terminator), reply_length)
+            elif len(self._rx_buffer) >= reply_length:
+                reply_end = reply_length
+            elif now >= deadline or (gap > 0 and self._rx_buffer and now - self._rx_time >= gap):
+                reply_end = len(self._rx_buffer)
+            else:
+                wait_time = deadline - now
+                if gap > 0 and self._rx_buffer:
+                    wait_time = min(wait_time, gap - (now - self._rx_time))
+                self._rx_event.clear()
+                try:
+                    await asyncio.wait_for(self._rx_event.wait(), wait_time)
+                except asyncio.TimeoutError:
+                    pass
+        binary_data = bytes(self._rx_buffer[:reply_end])
+        del self._rx_buffer[:reply_end]
+        return binary_data
+
+    async def async_transaction(self, message, source):
+        """
+        Writes string1 (and string2 if present) of a message and returns the decoded reply to the last string sent.
+        """
+        debug = current_settings()['serial_debug']
+        self.clear_rx_buffer()
+        self.port.write(b64decode(message['string1']))
+        binary_data = await self.async_read_reply(message)
+        if debug:
+            logger.info('Serial Class: %s string 1 binary data: %s', source, binary_data)
+        if message['string2']:
+            self.port.write(b64decode(message['string2']))
+            binary_data = await self.async_read_reply(message)
+            if debug:
+                logger.info('Serial Class: %s string 2 binary data: %s', source, binary_data)
+        return bytes_decode(binary_data)
+
+    async def async_listen(self):
+        """
+        Collects the data on the bus for a listener mode port for up to the port timeout and returns it as a string.
+        """
+        self.clear_rx_buffer()
+        deadline = monotonic() + PORT_TIMEOUT
+        while len(self._rx_buffer) < self._read_buffer and monotonic() < deadline:
+            self._rx_event.clear()
+            try:
+                await asyncio.wait_for(self._rx_event.wait(), deadline - monotonic())
+            except asyncio.TimeoutError:
+                pass
+        binary_data = bytes(self._rx_buffer[:self._read_buffer])
+        self._rx_buffer.clear()
+        if current_settings()['serial_debug']:
+            logger.info('Serial Class: Listener binary data: %s', binary_data)
+        return bytes_decode(binary_data)
+
+    def submit(self, function, priority):
+        """
+        Queues a transaction coroutine function on this port from any thread and returns a Future for its result,
+        the queue is ordered in the same way as SerialConnection.submit. The Future is marked running when the
+        transaction is given the port, so a transaction can only be cancelled while it is still queued.
+        """
+        future = Future()
+        with self._close_lock:
+            if self._closed:
+                future.set_exception(serial.SerialException('%s is closed' % self._port))
+            else:
+                serial_engine().loop.call_soon_threadsafe(
+                    self._transactions.put_nowait, (priority, next(self._sequence), monotonic(), function, future))
+        return future
+
+    async def async_submit(self, transaction, priority):
+        """
+        Queues a transaction coroutine function on this port and waits for its result.
+        """
+        return await asyncio.wrap_future(self.submit(transaction, priority))
+
+    async def async_worker(self):
+        """
+        Runs the queued transactions for this port one at a time.
+        """
+        while True:
+            _, _, queued_time, transaction, future = await self._transactions.get()
+            if not future.set_running_or_notify_cancel():  # the api command timed out while queued
+                continue
+            self.record_wait(queued_time)
+            try:
+                future.set_result(await transaction())
+            except asyncio.CancelledError:  # the port was closed during the transaction
+                future.set_exception(serial.SerialException('%s is closed' % self._port))
+                raise
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                future.set_exception(error)
+
+    async def async_listener(self):
+        """
+        Polls the listener messages at the poll interval, the asyncio equivalent of listener_timer.
+        """
+        while True:
+            try:
+                listener_values = []
+                if self._mode == 'interactive':
+                    for item in self._listener_messages:
+                        string_data = await self.async_submit(
+                            lambda message=item: self.async_transaction(message, 'Interactive'), LISTENER_PRIORITY)
+                        listener_values.append(self.interactive_value(item, string_data))
+                else:
+                    string_data = await self.async_submit(self.async_listen, LISTENER_PRIORITY)
+                    for item in self._listener_messages:
+                        listener_values.append(self.listener_value(item, string_data))
+                self.update_listener_values(listener_values)
+            except Exception:  # pylint: disable=broad-exception-caught
+                logger.exception('Serial Class: Listener Read Error on %s', self._port)
+            await asyncio.sleep(self._poll_interval)
+
+    def api_command(self, item, command):
+        """
+        Executes an API command on the asyncio serial engine, the caller's thread waits for the reply.
+        """
+        if not self._port_ready:
+            return {'item': item, 'command': command, 'values': '', 'exception': 'Serial Port Error or not ready'}
+        try:
+            for message_item in self._api_messages:
+                if message_item['api-command'] == command:
+                    future = self.submit(lambda message=message_item: self.async_transaction(message, 'api'),
+                                         API_PRIORITY)
+                    try:
+                        string_data = future.result(timeout=TRANSACTION_TIMEOUT)
+                    except FutureTimeoutError:
+                        if future.cancel():  # still queued, the worker skips it so it is never sent
+                            raise
+                        string_data = future.result()  # already sent, its reply is bounded by the port timeout
+                    return {'item': item,'command': command, 'values': string_data}
+            return {'item': item, 'command': command, 'values': '', 'exception': 'Command not found'}
+        except FutureTimeoutError:
+            logger.error('Serial Class: API Command on %s timed out waiting for the port and was cancelled', self._port)
+            return {'item': item, 'command': command, 'values': '', 'exception': 'Serial Port busy'}
+        except serial.SerialException :
+            logger.exception('Serial Class: API Command Error on %s', self._port)
+            return {'item': item, 'command': command, 'values': '', 'exception': 'Serial Port Error or not ready'}
+
+
 def serial_http_data(item, command):
     """
     Collects and aggregates all listener values from all channels into a single dictionary for the index page.
@@ -457,14 +913,50 @@ def serial_api_parser(item, command):
         if item[:len(channel.name())] == channel.name():
             if item == channel.name() + 'status':
                 return {'item': item, 'command': command, 'values': channel.listener_values()}
+            if item == channel.name() + 'queue':
+                return {'item': item, 'command': command, 'values': channel.queue_info()}
+            if item == channel.name() + 'history':
+                return {'item': item, 'command': command, 'values': channel.history(command)}
             return channel.api_command(item, command)
     return {'item': item, 'command': command, 'values': '', 'exception': 'Command not found'}
 
 
+def serial_connection(channel_settings):
+    """
+    Returns a new connection for a serial channel setting using the engine selected by 'serial_engine'.
+    """
+    if settings['serial_engine'] == 'asyncio':
+        return AsyncSerialConnection(channel_settings)
+    return SerialConnection(channel_settings)
+
+
+def reload_serial_channels():
+    """
+    Closes the serial connections that have been deleted or whose settings (or the serial engine) have changed,
+    and opens connections for the new and changed channels. The other ports are not touched. Returns the api
+    names of the channels that were closed or opened.
+    """
+    configured = {channel_settings['api-name']: channel_settings for channel_settings in settings['serial_channels']}
+    changed = []
+    for name in list(serial_channels):
+        channel = serial_channels[name]
+        if configured.get(name) != channel.config or channel.ENGINE != settings['serial_engine']:
+            channel.close()
+            del serial_channels[name]
+            changed.append(name)
+    for name, channel_settings in configured.items():
+        if name not in serial_channels:
+            serial_channels[name] = serial_connection(channel_settings)
+            if name not in changed:
+                changed.append(name)
+    logger.info('Serial Class: serial channels reloaded, changed: %s', changed)
+    return changed
+
+
 # setup the serial channels
 serial_channels = {}
 for port in settings['serial_channels']:
-    serial_channels[port['api-name']] = SerialConnection(port)
+    serial_channels[port['api-name']] = serial_connection(port)
 
 
 def serial_api_checker(item):
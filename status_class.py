@@ -0,0 +1,135 @@
+"""
+Shared status snapshot of the controller for the web pages and Server-Sent Events.
+
+A single aggregator thread reads the controller status (CPU temperature, digital, analogue
+and serial values) every 'status_interval' seconds and publishes it as an immutable
+StatusSnapshot with a monotonic sequence number and the time it was taken. Every HTTP
+reader (the status page, /statusdata and /stream) is served from the latest snapshot, so
+the hardware is read once per interval however many clients are connected.
+
+Server-Sent Event clients receive the status only when it has changed, with a comment line
+sent every 'stream_heartbeat' seconds to keep the connection open.
+
+Usage:
+    from status_class import status_aggregator
+    status_aggregator.snapshot().status
+    Response(status_aggregator.events(), mimetype='text/event-stream')
+"""
+
+import json
+from collections import namedtuple
+from types import MappingProxyType
+from threading import Thread, Condition
+from time import sleep, time
+from app_control import settings
+from logmanager import logger
+from api_parser import parsecontrol
+
+StatusSnapshot = namedtuple('StatusSnapshot', ['sequence', 'timestamp', 'status', 'status_json'])
+"""
+sequence: increases by one for every snapshot taken\n
+timestamp: epoch time the snapshot was taken\n
+status: read only mapping of the status data\n
+status_json: the status data as a JSON object string
+"""
+
+
+def read_cpu_temperature():
+    """Read the CPU temperature and returns in in Celcius"""
+    with open(settings['cputemp'], 'r', encoding='utf-8') as f:
+        log = f.readline()
+    return round(float(log) / 1000, 1)
+
+
+def build_status():
+    """
+    Reads the status of the controller, this is the data shown on the status page.
+    """
+    return {'cputemperature': read_cpu_temperature(),
+            'digital_status': parsecontrol('digitalstatus', False),
+            'analogue_status': parsecontrol('analoguestatus', False),
+            'serial_status': parsecontrol('serialstatus', False)
+            }
+
+
+class StatusAggregator:
+    """
+    Takes a status snapshot every 'status_interval' seconds on one thread and shares it with all readers.
+    """
+    def __init__(self):
+        self._condition = Condition()
+        self._snapshot = StatusSnapshot(0, 0.0, MappingProxyType({}), '{}')
+        self._running = False
+
+    def start(self):
+        """Takes the first snapshot and starts the aggregator thread, if it is not already running."""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self.take_snapshot()
+        aggregator_thread = Thread(target=self.aggregator, daemon=True)
+        aggregator_thread.name = 'Status aggregator'
+        aggregator_thread.start()
+
+    def take_snapshot(self):
+        """Reads the status and publishes it as a new snapshot, waking any waiting readers."""
+        try:
+            status = build_status()
+            status_json = json.dumps(status, sort_keys=True)
+        except Exception:  # pylint: disable=broad-exception-caught
+            # any error keeps the last snapshot and the aggregator thread running, it is tried again next interval
+            logger.exception('Status Aggregator: error reading status')
+            return
+        with self._condition:
+            self._snapshot = StatusSnapshot(self._snapshot.sequence + 1, time(), MappingProxyType(status),
+                                            status_json)
+            self._condition.notify_all()
+
+    def aggregator(self):
+        """Background loop taking a snapshot every 'status_interval' seconds."""
+        while True:
+            sleep(settings['status_interval'])
+            self.take_snapshot()
+
+    def snapshot(self):
+        """Returns the latest snapshot, the object is never modified so it can be used without locking."""
+        if not self._running:
+            self.start()
+        return self._snapshot
+
+    def snapshot_json(self):
+        """
+        Returns the latest snapshot as a JSON object string with the sequence number and its age in seconds added.
+        """
+        snapshot = self.snapshot()
+        header = '{"age": %.3f, "sequence": %d' % (time() - snapshot.timestamp, snapshot.sequence)
+        if snapshot.status_json == '{}':
+            return header + '}'
+        return header + ', ' + snapshot.status_json[1:]
+
+    def events(self):
+        """
+        Generator of Server-Sent Event messages for one client, the current status is sent immediately and then each
+        time it changes. The event id is the snapshot sequence number.
+        """
+        sent_json = ''
+        sequence = -1
+        last_sent = time()
+        while True:
+            self.snapshot()
+            with self._condition:
+                self._condition.wait_for(lambda: self._snapshot.sequence != sequence,
+                                         timeout=max(settings['stream_heartbeat'] - (time() - last_sent), 0))
+                snapshot = self._snapshot
+            sequence = snapshot.sequence
+            if snapshot.status_json != sent_json:
+                sent_json = snapshot.status_json
+                last_sent = time()
+                yield 'id: %d\ndata: %s\n\n' % (snapshot.sequence, snapshot.status_json)
+            elif time() - last_sent >= settings['stream_heartbeat']:
+                last_sent = time()
+                yield ': heartbeat\n\n'
+
+
+status_aggregator = StatusAggregator()
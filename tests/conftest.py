@@ -0,0 +1,12 @@
+"""
+Test configuration: the modules are imported from the project folder, but app_control and logmanager write the
+settings file and the log in the working directory, so the tests run in a temporary folder.
+"""
+
+import os
+import sys
+import tempfile
+
+PROJECT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT)
+os.chdir(tempfile.mkdtemp(prefix='valve-controller-tests-'))
@@ -0,0 +1,52 @@
+"""
+Tests of the analogue sampler against simulated ADS1115 convertors, with several boards on one I2C bus.
+"""
+
+import threading
+import pytest
+
+pytest.importorskip('numpy')
+import analogue_class  # pylint: disable=wrong-import-position
+from analogue_class import SimulatedADS1115, SimulatedAnalogIn, AnalogueSampler  # pylint: disable=wrong-import-position
+
+
+def test_simulated_ads1115():
+    """A simulated convertor returns the voltage set on a pin and counts its conversions."""
+    device = SimulatedADS1115(0x48, 860)
+    pin = SimulatedAnalogIn(device, 2)
+    assert pin.voltage == pytest.approx(1.5)
+    device.set_voltage(2, 0.25)
+    assert pin.voltage == pytest.approx(0.25)
+    assert device.conversions == 2
+
+
+def test_channel_device(monkeypatch):
+    """Channels belong to board (n - 1) // 4 unless their setting names a device."""
+    channels = {1: {'pin': 0}, 6: {'pin': 1}, 9: {'pin': 2, 'device': 0}}
+    monkeypatch.setattr(analogue_class, 'analogue_channels', channels)
+    assert [analogue_class.channel_device(channel_id) for channel_id in channels] == [0, 1, 0]
+
+
+def test_sampler_reads_every_channel_of_each_board(monkeypatch):
+    """Each board has its own sampler thread and every enabled channel on each board is read."""
+    devices = {0: SimulatedADS1115(0x48, 860), 1: SimulatedADS1115(0x49, 860)}
+    for index, device in devices.items():
+        for pin in range(analogue_class.CHANNELS_PER_DEVICE):
+            device.set_voltage(pin, index + pin / 10)
+    channels = {channel_id: {'name': 'Analogue %d' % channel_id, 'pin': (channel_id - 1) % 4, 'enabled': True}
+                for channel_id in range(1, 9)}
+    channels[9] = {'name': 'Analogue 9', 'pin': 3, 'device': 0, 'enabled': True}  # a second input on pin 3
+    monkeypatch.setattr(analogue_class, 'analogue_channels', channels)
+    monkeypatch.setattr(analogue_class, 'analogue_calibrations', dict.fromkeys(channels))
+    sampler = AnalogueSampler(devices)
+    try:
+        names = {thread.name for thread in threading.enumerate()}
+        assert {'Analogue sampler 1', 'Analogue sampler 2'} <= names
+        for channel_id, channel in channels.items():
+            reading = sampler.reading(channel_id)
+            assert reading['samples'] > 0
+            assert reading['value'] == pytest.approx(channel.get('device', (channel_id - 1) // 4) + channel['pin'] / 10)
+        for device in devices.values():
+            assert device.conversions >= 4 * reading['samples']
+    finally:
+        sampler.stop()
@@ -0,0 +1,45 @@
+"""
+Tests of the conversion of analogue volts into engineering units.
+"""
+
+import pytest
+
+np = pytest.importorskip('numpy')
+from calibration_class import Calibration, make_calibration  # pylint: disable=wrong-import-position
+
+
+def test_polynomial():
+    """A polynomial calibration returns a float for one voltage and an array for several."""
+    polynomial = Calibration({'type': 'polynomial', 'coefficients': [1, 2, 3]})
+    assert polynomial.apply(2) == pytest.approx(17)
+    assert isinstance(polynomial.apply(2), float)
+    result = polynomial.apply([0, 1])
+    assert isinstance(result, np.ndarray)
+    assert list(result) == pytest.approx([1, 6])
+
+
+def test_table():
+    """A table calibration interpolates between its points and holds the end values beyond them."""
+    table = Calibration({'type': 'table', 'volts': [0, 1, 2], 'values': [0, 10, 40], 'units': 'C'})
+    assert table.apply(1.5) == pytest.approx(25)
+    assert table.apply(5) == pytest.approx(40)  # held at the end of the table
+    assert table.units == 'C'
+
+
+def test_loglinear():
+    """A log-linear gauge calibration raises the base to the linear function of the voltage."""
+    gauge = Calibration({'type': 'loglinear', 'slope': 1, 'offset': -5})
+    assert gauge.apply(3) == pytest.approx(0.01)
+    assert list(gauge.apply(np.array([2.0, 4.0]))) == pytest.approx([0.001, 0.1])
+    assert Calibration({'type': 'loglinear', 'slope': 1, 'offset': 0, 'base': 2}).apply(3) == pytest.approx(8)
+
+
+def test_settings_not_valid():
+    """Calibration settings that are not valid raise ValueError, make_calibration returns None for them."""
+    for config in ({'type': 'cubic'}, {'type': 'table', 'volts': [1, 0], 'values': [0, 1]},
+                   {'type': 'table', 'volts': [0, 1], 'values': [0]},
+                   {'type': 'polynomial', 'coefficients': []}, 'polynomial'):
+        with pytest.raises(ValueError):
+            Calibration(config)
+    assert make_calibration(None) is None
+    assert make_calibration({'type': 'loglinear'}, 'Gauge') is None  # no slope, logged
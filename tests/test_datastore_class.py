@@ -0,0 +1,48 @@
+"""
+Tests of the persistent time-series store.
+"""
+
+import sqlite3
+from time import time
+import pytest
+from datastore_class import DataStore, CALIBRATED_SUFFIX
+
+
+def test_query_calibrated(tmp_path):
+    """A calibrated query returns the stored calibrated series of a series with its units."""
+    store = DataStore(str(tmp_path / 'data.db'))
+    if not store.enabled:
+        pytest.skip('data store not enabled')
+    store.register_calibrated('analogue1', 'mbar')
+    store.record('analogue1', 2.0, 100.0)
+    store.record('analogue1' + CALIBRATED_SUFFIX, 1e-3, 100.0)
+    store.flush()
+    result = store.query_calibrated('analogue1', 0, 200, 'raw')
+    assert result['value'] == [1e-3]
+    assert result['units'] == 'mbar' and result['calibrated']
+    assert 'exception' in store.query_calibrated('analogue2', 0, 200, 'raw')
+
+
+def failing_connect():
+    """Stands in for DataStore.connect when the database cannot be written."""
+    raise sqlite3.OperationalError('disk I/O error')
+
+
+def test_rollup_waits_for_pending_samples(tmp_path, monkeypatch):
+    """A failed flush holds back the rollups until its samples have been written."""
+    store = DataStore(str(tmp_path / 'data.db'))
+    if not store.enabled:
+        pytest.skip('data store not enabled')
+    hour = (time() // 3600 - 2) * 3600  # an hour that is complete
+    for minute in range(60):
+        store.record('gauge', minute, hour + minute * 60 + 1)
+    connect = store.connect
+    monkeypatch.setattr(store, 'connect', failing_connect)
+    store.flush()  # the samples are kept for the next flush
+    monkeypatch.setattr(store, 'connect', connect)
+    store.rollup()
+    assert store.query('gauge', hour, hour + 3599, '1m')['time'] == []
+    store.flush()
+    store.rollup()
+    assert len(store.query('gauge', hour, hour + 3599, '1m')['time']) == 60
+    assert store.query('gauge', hour, hour + 3599, '1h')['value'] == [pytest.approx(29.5)]
@@ -0,0 +1,55 @@
+"""
+Tests of the in-memory reading history: the ring buffer, the API history window and reading values.
+"""
+
+from time import time
+import pytest
+from history_class import RingBuffer, history_window, reading_value
+
+
+def test_ring_buffer_overwrites_oldest():
+    """Once full the oldest samples are overwritten and a window returns the samples between its times."""
+    history = RingBuffer(5)
+    now = time()
+    for index in range(8):
+        history.append(index, now - 8 + index)
+    assert len(history) == 5
+    times, values = history.window()
+    assert list(values) == [3, 4, 5, 6, 7]
+    assert list(times) == pytest.approx([now - 5, now - 4, now - 3, now - 2, now - 1])
+    assert history.latest()[1] == 7
+    times, values = history.window(now - 4.5, now - 2.5)
+    assert list(values) == [4, 5]
+
+
+def test_ring_buffer_never_goes_back_in_time():
+    """A sample stamped before the one before it (a clock step) keeps the samples in order."""
+    history = RingBuffer(4)
+    now = time()
+    history.append(1, now)
+    history.append(2, now - 60)  # the wall clock was stepped back
+    times, values = history.window()
+    assert list(values) == [1, 2]
+    assert times[1] >= times[0]
+    assert RingBuffer(3).latest() is None
+
+
+def test_history_window():
+    """The history API window accepts seconds, a start and end, or the whole history."""
+    for command, seconds in (('60', 60), (30, 30), (2.5, 2.5)):
+        start, end = history_window(command)
+        assert end - start == pytest.approx(seconds)
+    assert history_window({'start': 10, 'end': 20}) == (10.0, 20.0)
+    for command in (False, None, '', 'all'):
+        assert history_window(command)[0] == 0.0
+    for command in ('soon', -5, True, [1]):
+        with pytest.raises(ValueError):
+            history_window(command)
+
+
+def test_reading_value():
+    """The number is taken from a reading that carries units or a label."""
+    assert reading_value('1.2E-08 Torr') == 1.2e-08
+    assert reading_value('Pressure 5 mbar') == 5.0
+    assert reading_value(3) == 3.0
+    assert reading_value('OFF') is None
@@ -0,0 +1,53 @@
+"""
+Tests of the interlock rules between the digital channels.
+"""
+
+from interlock_class import Interlocks
+
+DIGITAL_CHANNELS = {'1': {'name': 'Valve 1', 'direction': 'output', 'excluded': 2},
+                    '2': {'name': 'Valve 2', 'direction': 'output', 'excluded': 0},
+                    '3': {'name': 'Valve 3', 'direction': 'output', 'excluded': 0},
+                    '4': {'name': 'Door switch', 'direction': 'input', 'excluded': 0}}
+
+
+def test_violation():
+    """A channel may not open while all the channels of one of its rules are open."""
+    interlocks = Interlocks()
+    interlocks.compile([{'name': 'pump guard', 'channel': 3, 'when_open': [1, 2]}], DIGITAL_CHANNELS)
+    assert interlocks.violation(1) == ''
+    interlocks.set_state(2, 1)
+    assert interlocks.violation(1) == 'excluded partner "Valve 2"'
+    assert interlocks.violation(3) == ''
+    interlocks.set_state(1, 1)
+    assert interlocks.violation(3) == 'pump guard'
+    interlocks.set_state(2, 0)
+    assert interlocks.violation(3) == ''
+    assert interlocks.violation(3, state=0b110) == 'pump guard'
+    assert interlocks.violation(2) == ''
+
+
+def test_rules_not_valid_are_ignored():
+    """Rules naming unknown channels or no other channels are ignored, unnamed rules are numbered."""
+    interlocks = Interlocks()
+    interlocks.compile([{'channel': 9, 'when_open': [1]}, {'channel': 2, 'when_open': [2]},
+                        {'channel': 2, 'when_open': []}, {'channel': 2}, {'channel': 3, 'when_open': [1]}],
+                       DIGITAL_CHANNELS)
+    interlocks.set_state(1, 1)
+    interlocks.set_state(2, 1)
+    assert interlocks.violation(2) == ''
+    assert interlocks.violation(3) == 'interlock 5'
+    rules = interlocks.info('interlocks', '')['values']['rules']
+    assert [(rule['channel'], rule['when_open']) for rule in rules] == [(1, [2]), (3, [1])]
+
+
+def test_inputs_are_read_live():
+    """Input channels in a rule are read from the pin rather than the recorded state."""
+    levels = {4: 0}
+    interlocks = Interlocks()
+    interlocks.compile([{'name': 'door open', 'channel': 1, 'when_open': [4]}], DIGITAL_CHANNELS,
+                       read_input=lambda channel_id: levels[channel_id])
+    interlocks.set_state(4, 1)  # an input's recorded state is not used
+    assert interlocks.violation(1) == ''
+    levels[4] = 1
+    assert interlocks.violation(1) == 'door open'
+    assert interlocks.info('interlocks', '')['values']['open'] == [4]
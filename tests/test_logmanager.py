@@ -0,0 +1,99 @@
+"""
+Tests of the log viewer: reading a log backwards in pages across its rotated files, and the indexed log search.
+"""
+
+import time
+import logmanager
+
+
+def write_log(path, first, count):
+    """Writes log lines numbered first to first + count - 1, returns the lines."""
+    lines = ['line %05d %s' % (number, 'x' * (number % 7)) for number in range(first, first + count)]
+    with open(path, 'w', encoding='utf-8') as log_file:
+        log_file.write(''.join(line + '\n' for line in lines))
+    return lines
+
+
+def test_read_lines_backwards(tmp_path, monkeypatch):
+    """Lines are read newest first across several blocks, returning the offset of the oldest line."""
+    monkeypatch.setattr(logmanager, 'LOG_READ_BLOCK', 64)  # several blocks per read
+    path = tmp_path / 'app.log'
+    lines = write_log(path, 0, 200)
+    size = path.stat().st_size
+    newest, offset = logmanager.read_lines_backwards(str(path), size, 10)
+    assert newest == lines[:-11:-1]
+    assert offset == size - sum(len(line) + 1 for line in lines[-10:])
+    older, offset = logmanager.read_lines_backwards(str(path), offset, 1000)
+    assert older == lines[-11::-1]
+    assert offset == 0
+
+
+def test_read_log_page_follows_rotated_files(tmp_path):
+    """Paging from the newest line continues into the rotated backup and ends with no cursor."""
+    path = tmp_path / 'app.log'
+    old_lines = write_log(str(path) + '.1', 0, 30)
+    new_lines = write_log(path, 30, 30)
+    pages = []
+    cursor = ''
+    while True:
+        page, cursor = logmanager.read_log_page(str(path), cursor, 25)
+        assert len(page) <= 25
+        pages += page
+        if not cursor:
+            break
+    assert pages == (old_lines + new_lines)[::-1]
+
+
+def test_read_log_page_cursor_survives_rotation(tmp_path):
+    """A cursor still points at the same line after the log is rotated, a cursor that is not valid returns nothing."""
+    path = tmp_path / 'app.log'
+    lines = write_log(path, 0, 40)
+    page, cursor = logmanager.read_log_page(str(path), '', 10)
+    assert page == lines[:-11:-1]
+    (tmp_path / 'app.log').rename(tmp_path / 'app.log.1')  # the log is rotated between two pages
+    write_log(path, 40, 5)
+    page, cursor = logmanager.read_log_page(str(path), cursor, 10)
+    assert page == lines[-11:-21:-1]
+    assert logmanager.read_log_page(str(path), 'not-a-cursor', 10) == ([], '')
+    assert logmanager.read_log_page(str(tmp_path / 'missing.log')) == ([], '')
+
+
+def write_app_log(path, entries, mode='w'):
+    """Writes application log lines for (epoch time, level, message) entries, returns the lines."""
+    lines = ['[%s] [%s] %s' % (time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(stamp)), level, message)
+             for stamp, level, message in entries]
+    with open(path, mode, encoding='utf-8') as log_file:
+        log_file.write(''.join(line + '\n' for line in lines))
+    return lines
+
+
+def test_search_log(tmp_path, monkeypatch):
+    """Lines are found by word, level and time across the log and its backup, including lines added later."""
+    monkeypatch.setattr(logmanager, 'LOG_INDEX_BLOCK', 256)  # several blocks per file
+    path = str(tmp_path / 'app.log')
+    start = int(time.time()) - 1000
+    old = write_app_log(path + '.1', [(start + number, 'INFO', 'pump %d started' % number) for number in range(50)])
+    new = write_app_log(path, [(start + 100 + number, 'ERROR' if number % 10 == 0 else 'INFO',
+                                'valve %d Opened' % number) for number in range(50)])
+    assert logmanager.search_log(path, 'opened VALVE') == new[::-1]
+    assert logmanager.search_log(path, 'pump started', limit=5) == old[:-6:-1]
+    assert logmanager.search_log(path, level='error') == new[40::-10]
+    assert logmanager.search_log(path, 'valve', start=start + 120, end=start + 129) == new[29:19:-1]
+    assert logmanager.search_log(path, 'pump', start=start + 100) == []
+    assert logmanager.search_log(path, 'heater') == []
+    added = write_app_log(path, [(start + 200, 'INFO', 'heater on')], mode='a')
+    assert logmanager.search_log(path, 'heater') == added  # lines written since the last search are indexed
+
+
+def test_search_log_beyond_the_word_limit(tmp_path, monkeypatch):
+    """Words in the blocks after the index word limit are still found."""
+    monkeypatch.setattr(logmanager, 'LOG_INDEX_BLOCK', 256)
+    monkeypatch.setattr(logmanager, 'LOG_INDEX_MAX_TOKENS', 40)
+    path = str(tmp_path / 'app.log')
+    lines = write_app_log(path, [(time.time(), 'INFO', 'reading word%d' % number) for number in range(100)])
+    index = logmanager.LogIndex(path)
+    index.refresh()
+    file_index = next(iter(index._files.values()))  # pylint: disable=protected-access
+    assert file_index['unindexed'] is not None and len(file_index['tokens']) <= 40
+    assert index.search('word99') == [lines[99]]
+    assert index.search('word0') == [lines[0]]
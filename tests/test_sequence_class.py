@@ -0,0 +1,40 @@
+"""
+Tests of the parsing of valve sequences. sequence_class drives the digital channels, so these tests are skipped
+where the Raspberry Pi GPIO library cannot be loaded.
+"""
+
+import pytest
+
+try:
+    import sequence_class
+except (ImportError, RuntimeError) as exception:
+    pytest.skip('GPIO library not available: %s' % exception, allow_module_level=True)
+
+
+def step(channel_id, command):
+    """Returns the step setting a digital channel with a command."""
+    return '%s%d %s' % (sequence_class.settings['digital_prefix'], channel_id, command)
+
+
+def test_parse_steps():
+    """Steps are parsed into their channel, command and planned time from the start of the sequence."""
+    settings = sequence_class.settings
+    channel_id = next(iter(sequence_class.digital_channels))
+    on_step = step(channel_id, settings['digital_on_command'])
+    off_step = step(channel_id, settings['digital_off_command'])
+    parsed = sequence_class.parse_steps([on_step, 'wait 250 ms', 'WAIT 1.5 s', off_step, 'wait 2'])
+    assert [planned for _, planned, _, _ in parsed] == pytest.approx([0, 0.25, 1.75, 1.75, 3.75])
+    assert parsed[0][2] is sequence_class.digital_channels[channel_id]
+    assert parsed[0][3] == settings['digital_on_command']
+    assert parsed[3][3] == settings['digital_off_command']
+    assert parsed[1][2:] == (None, None)
+
+
+def test_steps_not_valid():
+    """A sequence that is not a list of valid steps raises ValueError."""
+    settings = sequence_class.settings
+    channel_id = next(iter(sequence_class.digital_channels))
+    for steps in ([], 'wait 1', ['wait soon'], ['wait -1'], [step(999, settings['digital_on_command'])],
+                  [step(channel_id, 'maybe')], ['%sx %s' % (settings['digital_prefix'], settings['digital_on_command'])]):
+        with pytest.raises(ValueError):
+            sequence_class.parse_steps(steps)
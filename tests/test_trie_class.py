@@ -0,0 +1,37 @@
+"""
+Tests of the prefix trie used to dispatch API items that carry a suffix.
+"""
+
+from trie_class import PrefixTrie
+
+
+def test_longest_prefix():
+    """The value of the longest key the item starts with is returned, or None."""
+    prefix = PrefixTrie()
+    prefix.insert('digital', 'digital')
+    prefix.insert('digitalstatus', 'status')
+    prefix.insert('ion-pump', 'ion')
+    assert prefix.longest_prefix('digital3-pwm') == 'digital'
+    assert prefix.longest_prefix('digitalstatus') == 'status'
+    assert prefix.longest_prefix('digitalstat') == 'digital'
+    assert prefix.longest_prefix('ion-pumpstart') == 'ion'
+    assert prefix.longest_prefix('ion') is None
+    assert prefix.longest_prefix('analogue1') is None
+    assert prefix.longest_prefix('') is None
+
+
+def test_empty_key_matches_everything():
+    """An empty key is the default for items no other key matches."""
+    prefix = PrefixTrie()
+    prefix.insert('', 'default')
+    prefix.insert('serial', 'serial')
+    assert prefix.longest_prefix('other') == 'default'
+    assert prefix.longest_prefix('serial1') == 'serial'
+
+
+def test_insert_replaces_value():
+    """Inserting a key again replaces its value."""
+    prefix = PrefixTrie()
+    prefix.insert('datastore', 'old')
+    prefix.insert('datastore', 'new')
+    assert prefix.longest_prefix('datastore') == 'new'
@@ -0,0 +1,38 @@
+"""
+Prefix trie used by api_parser to find the handler of an API item that carries a suffix.
+
+Usage:
+    from trie_class import PrefixTrie
+    prefix = PrefixTrie()
+    prefix.insert('digital', handler)
+    prefix.longest_prefix('digital3-pwm')  # returns handler
+"""
+
+
+class PrefixTrie:
+    """
+    Character trie mapping key prefixes to values, used to find the handler for items that carry a suffix
+    (e.g. digital3-pwm or ion-pumpstart). A lookup walks the item once and returns the value of the longest
+    key that the item starts with, so the time taken does not depend on how many keys are held.
+    """
+    def __init__(self):
+        self._root = {}
+
+    def insert(self, key, value):
+        """Adds a key and its value to the trie."""
+        node = self._root
+        for character in key:
+            node = node.setdefault(character, {})
+        node[None] = value
+
+    def longest_prefix(self, item):
+        """Returns the value of the longest key that item starts with, or None."""
+        node = self._root
+        value = node.get(None)
+        for character in item:
+            node = node.get(character)
+            if node is None:
+                break
+            if None in node:
+                value = node[None]
+        return value